@@ -1,14 +1,11 @@
 from app.config import settings  # pylint: disable=import-error
 from app import models  # pylint: disable=import-error,unused-import
 from app.models import Base  # pylint: disable=import-error
-from app.database import build_database_url  # pylint: disable=import-error
+from app.database import default_database  # pylint: disable=import-error
 from logging.config import fileConfig
 import sys
 from pathlib import Path
 
-from sqlalchemy import create_engine
-from sqlalchemy import pool
-
 from alembic import context  # pylint: disable=import-error
 
 # Add the parent directory to sys.path to import app modules
@@ -21,12 +18,13 @@ config = context.config  # pylint: disable=no-member
 
 # Override sqlalchemy.url from config to use the same settings as database.py
 # This ensures SSL configuration is properly applied for Render PostgreSQL
-database_url = build_database_url()
-config.set_main_option("sqlalchemy.url", database_url)
+database = default_database()
+config.set_main_option("sqlalchemy.url", database.url)
 
 # Interpret the config file for Python logging.
-# This line sets up loggers basically.
-if config.config_file_name is not None:
+# This line sets up loggers basically. Skipped when the app runs migrations
+# on its own connection (app/migrations.py) so the server's loggers survive.
+if config.config_file_name is not None and "connection" not in config.attributes:
     fileConfig(config.config_file_name)
 
 # add your model's MetaData object here
@@ -66,42 +64,28 @@ def run_migrations_offline() -> None:
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode.
 
-    In this scenario we need to create an Engine
-    and associate a connection with the context.
+    Uses the connection handed over by app/migrations.py when there is one,
+    otherwise a connection from the application's engine, so the SSL and
+    pool configuration of database.py applies here too.
 
     """
-    # Build connection arguments for SSL configuration
-    import re
-    connect_args = {}
-    # Detect Render PostgreSQL URLs (both internal and external)
-    is_render_db = re.search(
-        r"dpg-[a-z0-9]+-[a-z]", database_url.lower()) is not None
-
-    if is_render_db:
-        # Use prefer mode for Render PostgreSQL (more lenient SSL handling)
-        connect_args = {
-            "sslmode": "prefer",         # Prefer SSL but allow fallback
-            "keepalives": 1,
-            "keepalives_idle": 30,
-            "keepalives_interval": 10,
-            "keepalives_count": 5,
-            "connect_timeout": 30,
-        }
-
-    # Use create_engine directly to ensure connect_args are properly applied
-    connectable = create_engine(
-        database_url,
-        poolclass=pool.NullPool,
-        connect_args=connect_args,
-    )
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        run_migrations_on(connection)
+        return
+
+    with database.engine.connect() as connection:
+        run_migrations_on(connection)
+
 
-    with connectable.connect() as connection:
-        context.configure(  # pylint: disable=no-member
-            connection=connection, target_metadata=target_metadata
-        )
+def run_migrations_on(connection) -> None:
+    """Run the migrations on an open connection."""
+    context.configure(  # pylint: disable=no-member
+        connection=connection, target_metadata=target_metadata
+    )
 
-        with context.begin_transaction():  # pylint: disable=no-member
-            context.run_migrations()  # pylint: disable=no-member
+    with context.begin_transaction():  # pylint: disable=no-member
+        context.run_migrations()  # pylint: disable=no-member
 
 
 if context.is_offline_mode():  # type: ignore # pylint: disable=no-member
@@ -0,0 +1,47 @@
+"""add_posts_search_vector
+
+Revision ID: 2797e911c539
+Revises: 9f0d848f44d3
+Create Date: 2026-10-17 10:03:27.584110
+
+"""
+# pylint: disable=no-member
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2797e911c539'
+down_revision: Union[str, Sequence[str], None] = '9f0d848f44d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add a generated tsvector over title and content with a GIN index.
+
+    Only PostgreSQL has tsvector; other databases use the in-process index
+    in app/search.py.
+    """
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(
+        """
+        ALTER TABLE posts ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(content, '')), 'B')
+        ) STORED
+        """
+    )
+    op.create_index('ix_posts_search_vector', 'posts', ['search_vector'],
+                    postgresql_using='gin')
+
+
+def downgrade() -> None:
+    """Drop the posts search vector."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_posts_search_vector', table_name='posts')
+    op.drop_column('posts', 'search_vector')
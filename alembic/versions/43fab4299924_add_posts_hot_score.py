@@ -0,0 +1,45 @@
+"""add_posts_hot_score
+
+Revision ID: 43fab4299924
+Revises: 920faede1439
+Create Date: 2026-10-17 14:05:31.284190
+
+"""
+# pylint: disable=no-member
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '43fab4299924'
+down_revision: Union[str, Sequence[str], None] = '920faede1439'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add the precomputed hot ranking score and the ranked-page indexes."""
+    op.add_column('posts', sa.Column('hot_score', sa.Float(),
+                                     server_default='0', nullable=False))
+    # Same formula as app.ranking.hot_score; SQLite connections opened by the
+    # app have it registered as a function
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(
+            """
+            UPDATE posts SET hot_score = log(greatest(vote_count, 1))
+                + (extract(epoch FROM created_at) - 1134028003) / 45000
+            """
+        )
+    else:
+        op.execute("UPDATE posts SET hot_score = hot_score(vote_count, created_at)")
+    op.create_index('ix_posts_hot_score_id', 'posts', ['hot_score', 'id'])
+    op.create_index('ix_posts_vote_count_id', 'posts', ['vote_count', 'id'])
+
+
+def downgrade() -> None:
+    """Drop the hot ranking score and its indexes."""
+    op.drop_index('ix_posts_vote_count_id', table_name='posts')
+    op.drop_index('ix_posts_hot_score_id', table_name='posts')
+    op.drop_column('posts', 'hot_score')
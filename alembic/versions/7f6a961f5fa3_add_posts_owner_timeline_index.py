@@ -0,0 +1,29 @@
+"""add_posts_owner_timeline_index
+
+Revision ID: 7f6a961f5fa3
+Revises: 43fab4299924
+Create Date: 2026-10-17 16:22:47.519304
+
+"""
+# pylint: disable=no-member
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f6a961f5fa3'
+down_revision: Union[str, Sequence[str], None] = '43fab4299924'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Index each author's posts in timeline order."""
+    op.create_index('ix_posts_owner_id_created_at_id', 'posts',
+                    ['owner_id', 'created_at', 'id'])
+
+
+def downgrade() -> None:
+    """Drop the author timeline index."""
+    op.drop_index('ix_posts_owner_id_created_at_id', table_name='posts')
@@ -0,0 +1,37 @@
+"""add_posts_vote_count
+
+Revision ID: 920faede1439
+Revises: 2797e911c539
+Create Date: 2026-10-17 11:26:52.047915
+
+"""
+# pylint: disable=no-member
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '920faede1439'
+down_revision: Union[str, Sequence[str], None] = '2797e911c539'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add the denormalized vote counter to posts and backfill it."""
+    op.add_column('posts', sa.Column('vote_count', sa.Integer(),
+                                     server_default='0', nullable=False))
+    op.execute(
+        """
+        UPDATE posts SET vote_count = (
+            SELECT count(*) FROM votes WHERE votes.post_id = posts.id
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    """Drop the posts vote counter."""
+    op.drop_column('posts', 'vote_count')
@@ -0,0 +1,28 @@
+"""add_posts_created_at_id_index
+
+Revision ID: 9f0d848f44d3
+Revises: feb22cc24049
+Create Date: 2026-10-17 09:12:41.318204
+
+"""
+# pylint: disable=no-member
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9f0d848f44d3'
+down_revision: Union[str, Sequence[str], None] = 'feb22cc24049'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add the (created_at, id) index backing keyset pagination of posts."""
+    op.create_index('ix_posts_created_at_id', 'posts', ['created_at', 'id'])
+
+
+def downgrade() -> None:
+    """Drop the posts keyset pagination index."""
+    op.drop_index('ix_posts_created_at_id', table_name='posts')
@@ -0,0 +1,4 @@
+import time
+
+# Reference point for the startup timing printed by app.main
+import_started = time.perf_counter()
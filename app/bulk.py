@@ -0,0 +1,209 @@
+"""Bulk export and import of the users, posts and votes tables.
+
+Each table goes to or comes from ``<directory>/<table>.csv``. The files use
+PostgreSQL's CSV conventions (a header line, booleans as t/f, ISO
+timestamps, empty fields for NULL), so a dump taken from one database loads
+into the other.
+
+On PostgreSQL (psycopg2) data moves through COPY, streamed straight between
+the file and the server. Elsewhere rows are read with a server-side cursor
+and written with chunked executemany inserts. Either way memory use is
+bounded by the chunk size, not the table size.
+"""
+import csv
+import io
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Sequence
+from sqlalchemy import Table, func, select, text
+from sqlalchemy.engine import Connection, Engine
+from . import models
+
+# Parents before children so foreign keys hold while importing
+TABLES: Dict[str, Table] = {
+    "users": models.User.__table__,
+    "posts": models.Post.__table__,
+    "votes": models.Vote.__table__,
+}
+DEFAULT_CHUNK_SIZE = 10000
+
+
+@dataclass
+class TableResult:
+    table: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else float("inf")
+
+    def __str__(self) -> str:
+        return (f"{self.table}: {self.rows} rows in {self.seconds:.2f}s "
+                f"({self.rows_per_second:,.0f} rows/s)")
+
+
+def uses_copy(conn: Connection) -> bool:
+    """Whether the connection can stream COPY through psycopg2."""
+    return conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2"
+
+
+def table_path(directory: str, table: str) -> str:
+    return os.path.join(directory, f"{table}.csv")
+
+
+def _format_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return value
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() in ("t", "true", "1")
+
+
+_PARSERS: Dict[type, Callable[[str], object]] = {
+    int: int,
+    float: float,
+    bool: _parse_bool,
+    datetime: datetime.fromisoformat,
+}
+
+
+def _parsers(table: Table, columns: Sequence[str]) -> List[Callable[[str], object]]:
+    parsers = []
+    for name in columns:
+        column = table.columns[name]
+        parse = _PARSERS.get(column.type.python_type, str)
+        if parse is str:
+            parsers.append(str)
+        else:
+            # An empty field is NULL for every non-text column
+            parsers.append(lambda value, parse=parse: parse(value) if value else None)
+    return parsers
+
+
+def _read_header(table: Table, source: io.TextIOBase) -> List[str]:
+    columns = next(csv.reader([source.readline()]), [])
+    unknown = [name for name in columns if name not in table.columns]
+    if not columns or unknown:
+        raise ValueError(f"{table.name}: bad CSV header, unknown columns {unknown}")
+    return columns
+
+
+def _chunks(rows: Iterable[list], size: int) -> Iterable[List[list]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_table(conn: Connection, table: Table, out: io.TextIOBase,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Write a table as CSV to `out` and return the number of rows."""
+    columns = [column.name for column in table.columns]
+    if uses_copy(conn):
+        cursor = conn.connection.dbapi_connection.cursor()
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) "
+            "TO STDOUT WITH (FORMAT csv, HEADER)", out, size=chunk_size * 64)
+        return cursor.rowcount
+
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(columns)
+    rows = 0
+    result = conn.execute(
+        select(table).order_by(*table.primary_key.columns)
+        .execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        writer.writerows([_format_value(value) for value in row]
+                         for row in partition)
+        rows += len(partition)
+    return rows
+
+
+def import_table(conn: Connection, table: Table, source: io.TextIOBase,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Load CSV rows from `source` into a table and return the number of rows.
+
+    The header line names the columns, in any order; columns it leaves out
+    get their defaults.
+    """
+    columns = _read_header(table, source)
+    if uses_copy(conn):
+        cursor = conn.connection.dbapi_connection.cursor()
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            source, size=chunk_size * 64)
+        return cursor.rowcount
+
+    parsers = _parsers(table, columns)
+    statement = table.insert()
+    rows = 0
+    for chunk in _chunks(csv.reader(source), chunk_size):
+        conn.execute(statement, [
+            {name: parse(value) for name, parse, value in zip(columns, parsers, row)}
+            for row in chunk
+        ])
+        rows += len(chunk)
+    return rows
+
+
+def reset_sequences(conn: Connection, tables: Iterable[Table]):
+    """Move PostgreSQL id sequences past rows that were loaded with their ids."""
+    if conn.dialect.name != "postgresql":
+        return
+    for table in tables:
+        if "id" not in table.columns:
+            continue
+        # pylint: disable=not-callable
+        max_id = conn.execute(select(func.max(table.c.id))).scalar()
+        # pylint: enable=not-callable
+        conn.execute(text("SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                          ":value, :called)"),
+                     {"table": table.name, "value": max_id or 1,
+                      "called": max_id is not None})
+
+
+def export_tables(engine: Engine, directory: str, tables: Sequence[str],
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[TableResult]:
+    """Export tables to CSV files from one consistent snapshot."""
+    os.makedirs(directory, exist_ok=True)
+    results = []
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            conn = conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            for name in tables:
+                started = time.perf_counter()
+                with open(table_path(directory, name), "w", newline="",
+                          encoding="utf-8") as out:
+                    rows = export_table(conn, TABLES[name], out, chunk_size)
+                results.append(TableResult(name, rows, time.perf_counter() - started))
+    return results
+
+
+def import_tables(engine: Engine, directory: str, tables: Sequence[str],
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[TableResult]:
+    """Import CSV files into the tables in a single transaction."""
+    ordered = [name for name in TABLES if name in tables]
+    results = []
+    with engine.begin() as conn:
+        for name in ordered:
+            started = time.perf_counter()
+            with open(table_path(directory, name), newline="",
+                      encoding="utf-8") as source:
+                rows = import_table(conn, TABLES[name], source, chunk_size)
+            results.append(TableResult(name, rows, time.perf_counter() - started))
+        reset_sequences(conn, [TABLES[name] for name in ordered])
+    return results
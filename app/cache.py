@@ -0,0 +1,340 @@
+"""In-process caches with an optional shared backend.
+
+TTLCache is a thread-safe LRU with per-entry expiry and hit/miss counters. When
+a CacheBackend is attached, local misses fall through to it and writes and
+deletes are mirrored to it, so several workers can share entries; each worker's
+local copy still expires after the cache TTL. Every TTLCache is listed in
+`caches` by namespace, and app.instrumentation exports their counters.
+
+ResponseCache keeps serialized GET responses keyed on path and query string,
+tagged with a version number that writes bump, and answers If-None-Match
+with 304 from memory.
+
+Backends are blocking clients. Async code reaches them through the *_async
+methods and deferred_invalidation(), which use the threadpool, so a Redis
+round trip never holds up the event loop.
+"""
+import hashlib
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import orjson
+from fastapi import Request, Response, status
+from starlette.concurrency import run_in_threadpool
+from .config import settings
+
+
+class CacheBackend:
+    """A shared key/value store used behind the in-process caches."""
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+
+class RedisBackend(CacheBackend):
+    """CacheBackend over a redis-py compatible client."""
+
+    def __init__(self, client, prefix: str = "fastapi_sm:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key: str) -> int:
+        return self.client.incr(self.prefix + key)
+
+
+def backend_from_settings() -> Optional[CacheBackend]:
+    """Build the shared backend configured by CACHE_REDIS_URL, if any."""
+    if not settings.cache_redis_url:
+        return None
+    try:
+        import redis  # pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        raise RuntimeError(
+            "CACHE_REDIS_URL is set but the 'redis' package is not installed"
+        ) from exc
+    return RedisBackend(redis.Redis.from_url(settings.cache_redis_url))
+
+
+# Caches by namespace, for metrics
+caches: "weakref.WeakValueDictionary[str, TTLCache]" = weakref.WeakValueDictionary()
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire `ttl` seconds after being set."""
+
+    def __init__(self, namespace: str, max_size: int, ttl: float,
+                 backend: Optional[CacheBackend] = None,
+                 dumps: Callable[[Any], bytes] = orjson.dumps,
+                 loads: Callable[[bytes], Any] = orjson.loads):
+        self.namespace = namespace
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self.dumps = dumps
+        self.loads = loads
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        caches[namespace] = self
+
+    def _backend_key(self, key: Hashable) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss."""
+        now = time.monotonic()
+        value = self._get_local(key, now)
+        if value is not None:
+            return value
+        return self._get_shared(key, now)
+
+    async def get_async(self, key: Hashable) -> Optional[Any]:
+        """get() for async code; only backend lookups go to the threadpool."""
+        now = time.monotonic()
+        value = self._get_local(key, now)
+        if value is not None:
+            return value
+        if self.backend is None:
+            self._count_miss()
+            return None
+        return await run_in_threadpool(self._get_shared, key, now)
+
+    def _get_local(self, key: Hashable, now: float) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+        return None
+
+    def _get_shared(self, key: Hashable, now: float) -> Optional[Any]:
+        if self.backend is not None:
+            raw = self.backend.get(self._backend_key(key))
+            if raw is not None:
+                value = self.loads(raw)
+                self._store(key, value, now)
+                with self._lock:
+                    self.hits += 1
+                return value
+        self._count_miss()
+        return None
+
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def set(self, key: Hashable, value: Any):
+        """Cache value under key, evicting the least recently used entry if full."""
+        self._store(key, value, time.monotonic())
+        if self.backend is not None:
+            self.backend.set(self._backend_key(key), self.dumps(value), self.ttl)
+
+    async def set_async(self, key: Hashable, value: Any):
+        """set() for async code; the backend write runs in the threadpool."""
+        if self.backend is None:
+            self.set(key, value)
+        else:
+            await run_in_threadpool(self.set, key, value)
+
+    def delete(self, key: Hashable):
+        """Drop key locally and from the shared backend."""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(self._backend_key(key))
+
+    def clear(self):
+        """Drop every local entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current local size."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self._entries)}
+
+    def _store(self, key: Hashable, value: Any, now: float):
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(
+        tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class CachedLookup:
+    """Result of ResponseCache.lookup: a response to send, or a slot to fill."""
+
+    def __init__(self, cache: "ResponseCache", request: Request, key: str,
+                 version: int, response: Optional[Response] = None):
+        self.cache = cache
+        self.request = request
+        self.key = key
+        self.version = version
+        self.response = response
+
+    def store(self, body: bytes, headers: Optional[Dict[str, str]] = None) -> Response:
+        """Cache a freshly computed JSON body and build the response for it.
+
+        The entry is filed under the version seen before computing it, so a
+        write that lands meanwhile can't leave a stale body cached.
+        """
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        headers = dict(headers or {})
+        if (self.cache.enabled and time.monotonic() - self.cache.last_invalidated
+                >= self.cache.settle_seconds):
+            self.cache.entries.set((self.key, self.version), (etag, body, headers))
+        return self.cache.build_response(self.request, etag, body, headers)
+
+
+class ResponseCache:
+    """Versioned cache of serialized JSON responses with ETag support.
+
+    Any write affecting the cached resources calls invalidate(), which bumps
+    the version so every older entry stops matching. With a shared backend
+    the version lives there, so a write on one worker invalidates them all.
+    ETags are content hashes and therefore agree across workers.
+
+    Bodies computed within `settle_seconds` of this worker's last invalidation
+    are served but not cached, since they may come from a lagging replica.
+    When not `enabled` nothing is cached, but responses still carry ETags and
+    matching requests still get 304.
+    """
+
+    def __init__(self, namespace: str, max_size: int, ttl: float,
+                 backend: Optional[CacheBackend] = None, settle_seconds: float = 0,
+                 enabled: bool = True):
+        self.namespace = namespace
+        self.backend = backend
+        self.settle_seconds = settle_seconds
+        self.enabled = enabled
+        self.entries = TTLCache(f"{namespace}-responses", max_size=max_size, ttl=ttl)
+        self._version = 0
+        self.last_invalidated = float("-inf")
+        self._lock = threading.Lock()
+
+    @property
+    def _version_key(self) -> str:
+        return f"{self.namespace}:version"
+
+    def version(self) -> int:
+        if self.backend is not None:
+            return int(self.backend.get(self._version_key) or 0)
+        return self._version
+
+    def invalidate(self):
+        """Make every cached response stale.
+
+        Inside deferred_invalidation() the shared version is only bumped when
+        the block exits; this worker's entries are stale at once either way.
+        """
+        with self._lock:
+            self._version += 1
+            self.last_invalidated = time.monotonic()
+        if self.backend is not None:
+            deferred = _deferred_invalidations.get()
+            if deferred is not None:
+                deferred.append(self)
+            else:
+                self.publish_invalidation()
+
+    def publish_invalidation(self):
+        self.backend.incr(self._version_key)
+
+    def lookup(self, request: Request) -> CachedLookup:
+        """Find the cached response for this request's path and query string."""
+        if not self.enabled:
+            return CachedLookup(self, request, "", 0)
+        query = "&".join(sorted(f"{k}={v}"
+                                for k, v in request.query_params.multi_items()))
+        # Apps on different databases must not see each other's entries
+        key = f"{request.app.state.database.key}:{request.url.path}?{query}"
+        version = self.version()
+        lookup = CachedLookup(self, request, key, version)
+        entry = self.entries.get((key, version))
+        if entry is not None:
+            etag, body, headers = entry
+            lookup.response = self.build_response(request, etag, body, headers)
+        return lookup
+
+    async def lookup_async(self, request: Request) -> CachedLookup:
+        """lookup() for async handlers; the shared version is read in the threadpool.
+
+        CachedLookup.store() only touches process memory, so it needs no
+        async counterpart.
+        """
+        if self.backend is None:
+            return self.lookup(request)
+        return await run_in_threadpool(self.lookup, request)
+
+    @staticmethod
+    def build_response(request: Request, etag: str, body: bytes,
+                       headers: Dict[str, str]) -> Response:
+        headers = {**headers, "ETag": etag, "Cache-Control": "private, no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+
+# Caches invalidated inside the current deferred_invalidation() block
+_deferred_invalidations: ContextVar[Optional[List[ResponseCache]]] = ContextVar(
+    "deferred_invalidations", default=None)
+
+
+def _publish_invalidations(caches: List[ResponseCache]):
+    for cache in caches:
+        cache.publish_invalidation()
+
+
+@asynccontextmanager
+async def deferred_invalidation():
+    """Publish invalidations made inside the block from the threadpool on exit.
+
+    For async handlers whose writes run in AsyncSession.run_sync, which runs
+    on the event loop thread.
+    """
+    deferred: List[ResponseCache] = []
+    token = _deferred_invalidations.set(deferred)
+    try:
+        yield
+    finally:
+        _deferred_invalidations.reset(token)
+        if deferred:
+            await run_in_threadpool(_publish_invalidations, deferred)
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Literal, Optional
 
 
 class Settings(BaseSettings):
@@ -12,6 +12,61 @@ class Settings(BaseSettings):
     secret_key: str = "your-secret-key-here"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    # Argon2 cost; stored hashes made with other values are upgraded on login
+    argon2_time_cost: int = 3
+    argon2_memory_cost: int = 65536
+    argon2_parallelism: int = 4
+    # Hashing worker processes (0 hashes in the request thread), the number of
+    # jobs admitted before answering 503, and how long a request waits for one
+    password_hash_workers: int = 2
+    password_hash_max_pending: int = 16
+    password_hash_timeout_seconds: float = 5.0
+    # Upgrade the schema at startup when it is behind the migration scripts
+    auto_migrate: bool = True
+    # Serve requests from async routers on SQLAlchemy's asyncio engine
+    async_database: bool = False
+    # Authenticated-user cache; set cache_redis_url to share it across workers
+    user_cache_ttl_seconds: float = 60
+    user_cache_max_size: int = 10000
+    cache_redis_url: Optional[str] = None
+    # Verified bearer tokens per worker; revocations reach other workers
+    # (through cache_redis_url) within token_cache_ttl_seconds
+    token_cache_ttl_seconds: float = 60
+    token_cache_max_size: int = 10000
+    # Serialized GET /posts responses, invalidated by any post or vote write.
+    # Invalidations only reach other workers through cache_redis_url, so
+    # unless enabled explicitly (e.g. for a single worker) responses are
+    # only cached when it is set
+    response_cache_enabled: Optional[bool] = None
+    response_cache_ttl_seconds: float = 300
+    response_cache_max_size: int = 1000
+    # Connection pool per worker process; unset sizes keep the Render-aware
+    # defaults. pre_ping: "checkout" pings on every checkout, "background"
+    # pings idle connections every db_liveness_interval_seconds, "none" never
+    db_pool_size: Optional[int] = None
+    db_max_overflow: Optional[int] = None
+    db_pool_timeout: float = 30
+    db_pool_recycle: Optional[int] = None
+    db_pre_ping: Literal["checkout", "background", "none"] = "checkout"
+    db_liveness_interval_seconds: float = 30
+    # Comma-separated read replica URLs for GET endpoints, and how long a
+    # client is kept on the primary after a write (read-your-writes)
+    database_replica_urls: Optional[str] = None
+    read_your_writes_seconds: float = 5
+    # Token-bucket rate limiting per user, or per client address when
+    # anonymous: bursts of rate_limit_burst tokens refilled at
+    # rate_limit_per_second; costs per route are in app.ratelimit
+    rate_limit_enabled: bool = False
+    rate_limit_burst: float = 60
+    rate_limit_per_second: float = 1
+    rate_limit_redis_url: Optional[str] = None
+    # Answer 503 at once while this many requests wait for a pooled
+    # connection (0 disables)
+    load_shed_pool_waiters: int = 0
+    # Per-request SQL/pool/handler timing, Server-Timing headers and /metrics
+    instrumentation: bool = False
+    slow_query_ms: float = 200
+    log_level: str = "INFO"
 
     class Config:
         env_file = ".env"
@@ -1,36 +1,49 @@
 # database.py
+import hashlib
+import itertools
 import re
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
 from urllib.parse import quote_plus
-from sqlalchemy import create_engine
+from fastapi import Request
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import QueuePool
-from .config import settings
+from .config import Settings, settings
+from .instrumentation import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+from .ranking import hot_score
+
+# Render PostgreSQL hostnames, internal (dpg-xxx-a) and external
+# (dpg-xxx-a.oregon-postgres.render.com)
+RENDER_HOST = re.compile(r"dpg-[a-z0-9]+-[a-z]")
+
+
+def is_render_url(url: str) -> bool:
+    return RENDER_HOST.search(url.lower()) is not None
 
 
 # ------------------------------------------------------------------
 # 1. Build the DATABASE URL with proper encoding
 # ------------------------------------------------------------------
-def build_database_url():
+def build_database_url(app_settings: Settings = settings):
     """Build database URL with proper SSL configuration for Render."""
-    if settings.database_url:
-        url = settings.database_url
+    if app_settings.database_url:
+        url = app_settings.database_url
     else:
         # Build from individual vars (fallback)
-        pwd = quote_plus(settings.database_password)  # URL-encode password
+        pwd = quote_plus(app_settings.database_password)  # URL-encode password
         url = (
             f"postgresql+psycopg2://"
-            f"{settings.database_user}:{pwd}@"
-            f"{settings.database_host}:{settings.database_port}/"
-            f"{settings.database_name}"
+            f"{app_settings.database_user}:{pwd}@"
+            f"{app_settings.database_host}:{app_settings.database_port}/"
+            f"{app_settings.database_name}"
         )
 
-    # Detect Render PostgreSQL URLs (both internal and external)
-    # Internal URLs: dpg-xxx-a (short hostname) - NOT recommended, causes SSL issues
-    # External URLs: dpg-xxx-a.oregon-postgres.render.com (full domain) - RECOMMENDED
-    is_render_db = re.search(r"dpg-[a-z0-9]+-[a-z]", url.lower()) is not None
-
-    if is_render_db:
+    # Internal Render URLs are NOT recommended, they cause SSL issues
+    if is_render_url(url):
         # Convert postgres:// to postgresql:// (SQLAlchemy 2.x requirement)
         if url.startswith("postgres://"):
             url = url.replace("postgres://", "postgresql://", 1)
@@ -50,81 +63,249 @@ def build_database_url():
     return url
 
 
-SQLALCHEMY_DATABASE_URL = build_database_url()
+def build_async_database_url(url: str) -> str:
+    """Swap the driver of a sync database URL for its asyncio counterpart."""
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+psycopg://" + url[len(prefix):]
+    return url
 
 
 # ------------------------------------------------------------------
 # 2. Connection arguments for Render PostgreSQL
 # ------------------------------------------------------------------
-connect_args = {}
-# Detect Render PostgreSQL URLs (both internal and external)
-is_render_db = re.search(r"dpg-[a-z0-9]+-[a-z]",
-                         SQLALCHEMY_DATABASE_URL.lower()) is not None
-
-if is_render_db:
-    # Use prefer mode for Render PostgreSQL (more lenient SSL handling)
-    connect_args = {
-        "sslmode": "prefer",         # Prefer SSL but allow fallback
-        "keepalives": 1,             # Enable TCP keepalives
-        "keepalives_idle": 30,       # Start keepalives after 30s idle
-        "keepalives_interval": 10,   # Send keepalive every 10s
-        "keepalives_count": 5,       # Fail after 5 missed keepalives
-        "connect_timeout": 30,       # Increased connection timeout for Render
-    }
+def build_connect_args(url: str) -> dict:
+    if url.startswith("sqlite"):
+        # SQLite (local/test setups): sessions are used from FastAPI's threadpool
+        return {"check_same_thread": False}
+    if is_render_url(url):
+        # Use prefer mode for Render PostgreSQL (more lenient SSL handling)
+        return {
+            "sslmode": "prefer",         # Prefer SSL but allow fallback
+            "keepalives": 1,             # Enable TCP keepalives
+            "keepalives_idle": 30,       # Start keepalives after 30s idle
+            "keepalives_interval": 10,   # Send keepalive every 10s
+            "keepalives_count": 5,       # Fail after 5 missed keepalives
+            "connect_timeout": 30,       # Increased connection timeout for Render
+        }
+    return {}
 
 
 # ------------------------------------------------------------------
-# 3. Create engine with robust connection pooling
+# 3. Robust connection pooling
 # ------------------------------------------------------------------
-# Configure pool settings based on environment
-is_render = re.search(r"dpg-[a-z0-9]+-[a-z]",
-                      SQLALCHEMY_DATABASE_URL.lower()) is not None
-pool_size = 3 if is_render else 5  # Smaller pool for Render stability
-max_overflow = 5 if is_render else 10  # Fewer overflow connections for Render
-# Shorter recycle for Render (2 min)
-pool_recycle_time = 120 if is_render else 300
-
-# Create engine - don't test connection during import
-# pool_pre_ping=True will verify connections when they're actually used
-# This prevents blocking server startup if database isn't ready yet
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args=connect_args,
-    poolclass=QueuePool,
-    pool_size=pool_size,
-    max_overflow=max_overflow,
-    # Verify connections before using (critical for Render)
-    pool_pre_ping=True,
-    # Recycle connections to prevent stale SSL connections
-    pool_recycle=pool_recycle_time,
-    pool_reset_on_return='commit',
-    echo=False,
-)
+def build_pool_options(app_settings: Settings, is_render: bool) -> dict:
+    """Pool settings shared by the primary, async and replica engines."""
+    # Settings override these; size the pool so workers x (size + overflow)
+    # stays under the server's connection limit
+    pool_size = app_settings.db_pool_size
+    if pool_size is None:
+        pool_size = 3 if is_render else 5  # Smaller pool for Render stability
+    max_overflow = app_settings.db_max_overflow
+    if max_overflow is None:
+        max_overflow = 5 if is_render else 10  # Fewer overflow connections for Render
+    pool_recycle_time = app_settings.db_pool_recycle
+    if pool_recycle_time is None:
+        # Shorter recycle for Render (2 min)
+        pool_recycle_time = 120 if is_render else 300
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": app_settings.db_pool_timeout,
+        # Verify connections on every checkout unless liveness is checked in
+        # the background (app.pool_health) or not at all
+        "pool_pre_ping": app_settings.db_pre_ping == "checkout",
+        # Recycle connections to prevent stale SSL connections
+        "pool_recycle": pool_recycle_time,
+        "echo": False,
+    }
 
 
 # ------------------------------------------------------------------
-# 4. Connection event listeners (optional, for debugging)
+# 4. Connection event listeners
 # ------------------------------------------------------------------
-# Uncomment if you need to debug connections:
-# @event.listens_for(engine, "connect")
-# def receive_connect(dbapi_conn, connection_record):
-#     """Log when a connection is established."""
-#     print(f"Database connection established: {dbapi_conn}")
+def register_sqlite_functions(dbapi_conn, connection_record):
+    """Provide the PostgreSQL functions used by server defaults."""
+    dbapi_conn.create_function(
+        "now", 0,
+        lambda: datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f"))
+    dbapi_conn.create_function("hot_score", 2, hot_score, deterministic=True)
+
+# Statement timing listeners are added by app.instrumentation.install()
+# when INSTRUMENTATION is on.
 
 
 # ------------------------------------------------------------------
-# 5. Session & Base
+# 5. Engines & sessions, created on first use
 # ------------------------------------------------------------------
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class Database:
+    """Engines and session factories for one Settings.
+
+    Nothing is created, and no database driver imported, until an engine or
+    session factory is first asked for; app startup does that for the
+    primary. Every app built by app.main.create_app owns one Database, kept
+    in app.state.database. Asyncio engines (ASYNC_DATABASE=true) and read
+    replicas (DATABASE_REPLICA_URLS, routed by app.replicas) share the
+    primary's pool configuration, per engine.
+    """
+
+    def __init__(self, app_settings: Settings = settings):
+        self.settings = app_settings
+        self.url = build_database_url(app_settings)
+        self.replica_urls = [url.strip() for url in
+                             (app_settings.database_replica_urls or "").split(",")
+                             if url.strip()]
+        # Same for every app and worker using this database, so it can
+        # scope shared cache entries
+        self.key = hashlib.blake2b(self.url.encode(), digest_size=8).hexdigest()
+        self.connect_args = build_connect_args(self.url)
+        self.pool_options = build_pool_options(app_settings, is_render_url(self.url))
+        # The background liveness loop (app.pool_health) only covers the
+        # serving engine, so replicas keep pinging on checkout instead
+        self.replica_pool_options = {
+            **self.pool_options,
+            "pool_pre_ping": app_settings.db_pre_ping != "none",
+        }
+        # Sync engines created so far (async ones by their sync_engine), and
+        # callbacks run on each new one
+        self.engines: List[Engine] = []
+        self.async_engines: List[AsyncEngine] = []
+        self.engine_hooks: List[Callable[[Engine], None]] = []
+        self._created: Dict[str, object] = {}
+        self._lock = threading.RLock()
+
+    def _lazy(self, name: str, create: Callable[[], object]):
+        value = self._created.get(name)
+        if value is None:
+            with self._lock:
+                value = self._created.get(name)
+                if value is None:
+                    value = self._created[name] = create()
+        return value
+
+    def add_engine_hook(self, hook: Callable[[Engine], None]):
+        """Run `hook` on every engine, including those already created."""
+        with self._lock:
+            self.engine_hooks.append(hook)
+            for engine in self.engines:
+                hook(engine)
+
+    def _setup(self, engine: Engine):
+        with self._lock:
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", register_sqlite_functions)
+            for hook in self.engine_hooks:
+                hook(engine)
+            self.engines.append(engine)
+
+    def _create_engine(self, url: str, pool_options: Optional[dict] = None) -> Engine:
+        engine = create_engine(
+            url,
+            connect_args=self.connect_args,
+            # QueuePool that also records how long checkouts wait
+            poolclass=InstrumentedQueuePool,
+            pool_reset_on_return='commit',
+            **(pool_options or self.pool_options),
+        )
+        self._setup(engine)
+        return engine
+
+    def _create_async_engine(self, url: str,
+                             pool_options: Optional[dict] = None) -> AsyncEngine:
+        # psycopg 3 accepts the same libpq connect_args used for Render
+        engine = create_async_engine(
+            build_async_database_url(url),
+            connect_args=self.connect_args,
+            poolclass=InstrumentedAsyncQueuePool,
+            **(pool_options or self.pool_options),
+        )
+        self._setup(engine.sync_engine)
+        self.async_engines.append(engine)
+        return engine
+
+    @property
+    def engine(self) -> Engine:
+        return self._lazy("engine", lambda: self._create_engine(self.url))
+
+    @property
+    def session_factory(self) -> sessionmaker:
+        return self._lazy("session_factory", lambda: self._sessionmaker(self.engine))
+
+    @property
+    def async_engine(self) -> Optional[AsyncEngine]:
+        """The asyncio engine, or None unless ASYNC_DATABASE is on."""
+        if not self.settings.async_database:
+            return None
+        return self._lazy("async_engine", lambda: self._create_async_engine(self.url))
+
+    @property
+    def async_session_factory(self) -> Optional[async_sessionmaker]:
+        if not self.settings.async_database:
+            return None
+        return self._lazy("async_session_factory",
+                          lambda: self._async_sessionmaker(self.async_engine))
+
+    @property
+    def serving_engine(self):
+        """The engine request handlers use: async when ASYNC_DATABASE is on."""
+        return self.async_engine if self.settings.async_database else self.engine
+
+    def _sessionmaker(self, engine: Engine) -> sessionmaker:
+        # info lets code holding a session find its Database
+        return sessionmaker(autocommit=False, autoflush=False, bind=engine,
+                            info={"database": self})
+
+    def _async_sessionmaker(self, engine: AsyncEngine) -> async_sessionmaker:
+        return async_sessionmaker(bind=engine, autoflush=False,
+                                  expire_on_commit=False, info={"database": self})
+
+    def next_replica_session_factory(self) -> sessionmaker:
+        """A replica's sessionmaker, round robin."""
+        replicas = self._lazy("replicas", lambda: itertools.cycle([
+            self._sessionmaker(self._create_engine(url, self.replica_pool_options))
+            for url in self.replica_urls]))
+        return next(replicas)
+
+    def next_async_replica_session_factory(self) -> async_sessionmaker:
+        """A replica's async_sessionmaker, round robin."""
+        replicas = self._lazy("async_replicas", lambda: itertools.cycle([
+            self._async_sessionmaker(
+                self._create_async_engine(url, self.replica_pool_options))
+            for url in self.replica_urls]))
+        return next(replicas)
+
+    async def dispose(self):
+        """Close every pooled connection; engines reconnect if used again."""
+        for engine in self.async_engines:
+            await engine.dispose()
+        async_sync_engines = {engine.sync_engine for engine in self.async_engines}
+        for engine in self.engines:
+            if engine not in async_sync_engines:
+                engine.dispose()
+
+
+_default_database: Optional[Database] = None
+
+
+def default_database() -> Database:
+    """The Database for the process-wide settings, used by scripts and app.main.app."""
+    global _default_database  # pylint: disable=global-statement
+    if _default_database is None:
+        _default_database = Database(settings)
+    return _default_database
+
+
 Base = declarative_base()
 
 
 # ------------------------------------------------------------------
 # 6. Dependency for FastAPI routes with error handling
 # ------------------------------------------------------------------
-def get_db():
+def get_db(request: Request):
     """Database dependency with proper error handling."""
-    db = SessionLocal()
+    db = request.app.state.database.session_factory()
     try:
         yield db
     except Exception:
@@ -132,3 +313,13 @@ def get_db():
         raise
     finally:
         db.close()
+
+
+async def get_async_db(request: Request):
+    """Async database dependency used by the routers in app.routers.aio."""
+    async with request.app.state.database.async_session_factory() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
@@ -0,0 +1,364 @@
+"""SQL and request timing instrumentation.
+
+QueryCounter is a scoped statement counter for benchmarks and checks.
+
+The engines always use the Instrumented*QueuePool classes, which keep
+per-pool checkout wait totals for the pool health endpoint.
+
+The rest is the opt-in request instrumentation enabled with
+INSTRUMENTATION=true: engine event listeners time every statement, pool
+checkout waits feed a histogram, and InstrumentationMiddleware
+attributes both to the request being served. Each response gets a
+Server-Timing header, totals are kept in an in-process metrics registry
+served at /metrics in the Prometheus text format (per worker process), and
+statements slower than SLOW_QUERY_MS are logged.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.responses import Response
+from .cache import caches
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1, 5)
+
+
+class QueryCounter:
+    """Count the SQL statements executed on an engine while the block runs."""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute",
+                     self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, "before_cursor_execute",
+                     self._before_cursor_execute)
+
+
+# ------------------------------------------------------------------
+# Metrics registry
+# ------------------------------------------------------------------
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(self.labels, labels)} {value}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float],
+                 labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        # labels -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = [(labels, list(counts), total)
+                      for labels, (counts, total) in self._values.items()]
+        names = self.labels + ("le",)
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield (f"{self.name}_bucket{_format_labels(names, labels + (le,))} "
+                       f"{cumulative}")
+            label_text = _format_labels(self.labels, labels)
+            yield f"{self.name}_sum{label_text} {total}"
+            yield f"{self.name}_count{label_text} {cumulative}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+        self.gauges = {}
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float],
+                  labels: Sequence[str] = ()) -> Histogram:
+        metric = Histogram(name, help, buckets, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, read):
+        """Register a gauge whose value is read by calling `read()` at scrape time.
+
+        Registering a name again replaces the previous gauge.
+        """
+        self.gauges[name] = (help, read)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for name, (help, read) in self.gauges.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {read()}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+http_requests = registry.counter(
+    "http_requests_total", "Requests served.", ("method", "route", "status"))
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "Time until the response started.",
+    REQUEST_BUCKETS, ("method", "route"))
+http_request_db_queries = registry.counter(
+    "http_request_db_queries_total", "SQL statements run while serving requests.",
+    ("method", "route"))
+http_request_db_seconds = registry.counter(
+    "http_request_db_seconds_total",
+    "Time spent in SQL statements while serving requests.",
+    ("method", "route"))
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "Duration of each SQL statement.", QUERY_BUCKETS)
+db_pool_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection, including opening new ones.",
+    QUERY_BUCKETS)
+
+
+# ------------------------------------------------------------------
+# Per-request statistics
+# ------------------------------------------------------------------
+class RequestStats:
+    """Database work attributed to the request being served."""
+
+    __slots__ = ("queries", "db_seconds", "pool_wait_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+    def server_timing(self, handler_seconds: float) -> str:
+        return (f'db;dur={self.db_seconds * 1000:.2f};desc="{self.queries} queries", '
+                f"pool;dur={self.pool_wait_seconds * 1000:.2f}, "
+                f"app;dur={handler_seconds * 1000:.2f}")
+
+
+# Mutated in place, so work done in threadpool copies of the context counts
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+# Set by install(); pools always keep their own wait totals
+_enabled = False
+
+
+class _TimedCheckout:
+    """Pool mixin that times waiting for (or opening) a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        # Checkouts in progress right now, read by the load shedder
+        self.waiting = 0
+        self._wait_lock = threading.Lock()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        with self._wait_lock:
+            self.waiting += 1
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            with self._wait_lock:
+                self.waiting -= 1
+                self.wait_count += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            if _enabled:
+                db_pool_wait.observe(waited)
+                stats = _request_stats.get()
+                if stats is not None:
+                    stats.pool_wait_seconds += waited
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    """QueuePool recording checkout wait times."""
+
+    # Log as the pool it stands in for, so "sqlalchemy" logging config
+    # (WARN unless configured) still applies
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.QueuePool"
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool recording checkout wait times."""
+
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.AsyncAdaptedQueuePool"
+
+
+def instrument_engine(engine: Engine, slow_query_seconds: float):
+    """Time every statement run on a (sync) engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                               executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        db_query_duration.observe(elapsed)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+        if elapsed >= slow_query_seconds:
+            logger.warning("Slow query (%.1fms): %s", elapsed * 1000, statement)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        started = (context.connection.info.get("query_started")
+                   if context.connection else None)
+        if started:
+            started.pop()
+
+
+class InstrumentationMiddleware:
+    """ASGI middleware collecting per-request timing and database work."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                handler_seconds = time.perf_counter() - started
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing",
+                                stats.server_timing(handler_seconds).encode()))
+                message = {**message, "headers": headers}
+                self._record(scope, message["status"], handler_seconds, stats)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stats.reset(token)
+
+    @staticmethod
+    def _record(scope, status: int, handler_seconds: float, stats: RequestStats):
+        route = scope.get("route")
+        # Route templates keep label cardinality bounded
+        path = getattr(route, "path", None) or "unmatched"
+        method = scope["method"]
+        http_requests.inc(1, method, path, str(status))
+        http_request_duration.observe(handler_seconds, method, path)
+        http_request_db_queries.inc(stats.queries, method, path)
+        http_request_db_seconds.inc(stats.db_seconds, method, path)
+
+
+def metrics_endpoint():
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def install(app, database, slow_query_ms: float):
+    """Enable request instrumentation and the /metrics endpoint on an app.
+
+    `database` is the app's app.database.Database; its engines are
+    instrumented as they get created. Hit and miss counts of the caches
+    created so far (app.cache.caches) are exported as gauges.
+    """
+    global _enabled  # pylint: disable=global-statement
+    _enabled = True
+    database.add_engine_hook(
+        lambda engine: instrument_engine(engine, slow_query_ms / 1000))
+    registry.gauge("db_pool_checked_out", "Connections currently checked out.",
+                   lambda: sum(engine.pool.checkedout() for engine in database.engines))
+    for namespace, cache in list(caches.items()):
+        name = namespace.replace("-", "_")
+        for stat in ("hits", "misses", "size"):
+            registry.gauge(f"cache_{name}_{stat}",
+                           f"{stat.capitalize()} of the {namespace} cache.",
+                           lambda cache=cache, stat=stat: cache.stats()[stat])
+    app.add_middleware(InstrumentationMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"],
+                      include_in_schema=False)
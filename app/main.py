@@ -1,68 +1,93 @@
-from typing import List
-from fastapi import FastAPI, status, HTTPException, Depends
-from sqlalchemy.orm import Session
-from .database import engine, get_db
-from . import models
-from .schemas import PostCreate, PostResponse, UserCreate, UserResponse
-from .utils import hash_password
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from .database import Database, default_database
+from . import instrumentation, import_started
+from .pool_health import liveness_loop, pool_stats
+from .ratelimit import LoadShedMiddleware, RateLimitMiddleware
+from .replicas import ReadYourWritesMiddleware
+from .utils import PasswordHashingBusy, hashing_pool
 from .routers import user, post, auth, vote
-from .config import settings
+from .routers.aio import (user as aio_user, post as aio_post, auth as aio_auth,
+                          vote as aio_vote)
+from .config import Settings, settings
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 # uncomment this to create the tables whne not  using alembic migration
-# models.Base.metadata.create_all(bind=engine)
+# from . import models
+# models.Base.metadata.create_all(bind=default_database().engine)
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
-# Add CORS middleware BEFORE startup event to ensure it processes all responses
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=False,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
-    allow_headers=["*"],
-    expose_headers=["*"],
-)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Check the database schema is at the latest migration.
 
-@app.on_event("startup")
-async def startup_event():
-    """Run database migrations on startup."""
-    import os
-    from alembic.config import Config
-    from alembic import command
-
-    # Get the project root directory (where alembic.ini is located)
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    alembic_ini_path = os.path.join(project_root, "alembic.ini")
+    A single query compares the recorded revision with the migration scripts;
+    migrations only run here when AUTO_MIGRATE is on and the schema is behind.
+    Deployments can instead run `python manage.py migrate` before starting
+    workers and set AUTO_MIGRATE=false. The check also creates the engine,
+    so the first request doesn't pay for it. On shutdown the background
+    liveness checks stop, pooled connections are closed and the password
+    hashing worker processes exit (they are started again if needed).
+    """
+    from starlette.concurrency import run_in_threadpool
+    from .migrations import ensure_schema
 
+    database = app.state.database
+    app_settings = database.settings
+    check_started = time.perf_counter()
     try:
-        alembic_cfg = Config(alembic_ini_path)
-        command.upgrade(alembic_cfg, "head")
-        print("Database migrations completed successfully")
-    except Exception as e:
+        outcome = await run_in_threadpool(ensure_schema, database.engine,
+                                          app_settings.auto_migrate)
+        logger.info("Database schema %s", outcome)
+    except Exception:
         # Log error but don't crash the app
-        print(f"Migration error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Migration error")
+    finished = time.perf_counter()
+    logger.info("Startup took %.3fs (imports %.3fs, schema check %.3fs)",
+                finished - import_started, _imports_finished - import_started,
+                finished - check_started)
+
+    liveness_task = None
+    if app_settings.db_pre_ping == "background":
+        liveness_task = asyncio.create_task(
+            liveness_loop(database.serving_engine,
+                          app_settings.db_liveness_interval_seconds))
+    try:
+        yield
+    finally:
+        if liveness_task is not None:
+            liveness_task.cancel()
+        await database.dispose()
+        hashing_pool.shutdown()
+
+
+async def password_hashing_busy_handler(request, exc):
+    """Shed login/signup load quickly instead of queueing behind Argon2."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server busy, please retry shortly"},
+        headers={"Retry-After": "1"},
+    )
 
 
 # Add exception handler to ensure CORS headers on all errors
-@app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Ensure CORS headers are added even on unhandled exceptions."""
     # Let FastAPI handle HTTPExceptions normally (they'll get CORS from middleware)
-    if isinstance(exc, (HTTPException, StarletteHTTPException)):
+    if isinstance(exc, StarletteHTTPException):
         raise exc
 
     # Log the actual error for debugging
-    import traceback
     error_detail = str(exc)
-    print(f"Unhandled exception: {error_detail}")
-    traceback.print_exc()
+    logger.error("Unhandled exception on %s %s", request.method, request.url.path,
+                 exc_info=exc)
 
     # For other exceptions, create a response with CORS headers
     # Include the error message in development, but be careful in production
@@ -76,13 +101,79 @@ async def global_exception_handler(request, exc):
     response.headers["access-control-allow-headers"] = "*"
     return response
 
-app.include_router(user.router)
-app.include_router(post.router)
-app.include_router(auth.router)
-app.include_router(vote.router)
 
+def create_app(app_settings: Settings = settings) -> FastAPI:
+    """Build an app serving the database described by `app_settings`.
+
+    Each app gets its own Database (engines, pools, sessions), created on
+    first use, so several apps can live in one process, e.g. one per test.
+    Token signing, password hashing and cache sizes follow the process-wide
+    settings; cached users and responses are scoped per database.
+    """
+    # No-op when the server (or a test runner) already configured logging
+    logging.basicConfig(level=app_settings.log_level,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    database = (default_database() if app_settings is settings
+                else Database(app_settings))
+    app = FastAPI(lifespan=lifespan)
+    app.state.database = database
+
+    # Added before CORS so CORS wraps them and their 429/503 responses carry
+    # the CORS headers too
+    if app_settings.load_shed_pool_waiters:
+        app.add_middleware(
+            LoadShedMiddleware,
+            pools=lambda: [getattr(database.serving_engine, "sync_engine",
+                                   database.serving_engine).pool],
+            max_waiters=app_settings.load_shed_pool_waiters)
+    if app_settings.rate_limit_enabled:
+        app.add_middleware(RateLimitMiddleware)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=False,
+        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
+        allow_headers=["*"],
+        expose_headers=["*"],
+    )
+
+    app.add_exception_handler(PasswordHashingBusy, password_hashing_busy_handler)
+    app.add_exception_handler(Exception, global_exception_handler)
+
+    if app_settings.async_database:
+        app.include_router(aio_user.router)
+        app.include_router(aio_post.router)
+        app.include_router(aio_auth.router)
+        app.include_router(aio_vote.router)
+    else:
+        app.include_router(user.router)
+        app.include_router(post.router)
+        app.include_router(auth.router)
+        app.include_router(vote.router)
+
+    if database.replica_urls:
+        app.add_middleware(ReadYourWritesMiddleware)
+
+    if app_settings.instrumentation:
+        instrumentation.install(app, database, slow_query_ms=app_settings.slow_query_ms)
+
+    @app.get("/")
+    def read_root():
+        """Root endpoint."""
+        return {"message": "FastAPI Social Media API", "docs": "/docs",
+                "redoc": "/redoc"}
+
+    @app.get("/health/pool")
+    def get_pool_health():
+        """Connection pool occupancy and checkout wait totals for this worker."""
+        serving_engine = database.serving_engine
+        return pool_stats(getattr(serving_engine, "sync_engine", serving_engine))
+
+    return app
+
+
+app = create_app()
 
-@app.get("/")
-def read_root():
-    """Root endpoint."""
-    return {"message": "FastAPI Social Media API", "docs": "/docs", "redoc": "/redoc"}
+_imports_finished = time.perf_counter()
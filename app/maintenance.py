@@ -0,0 +1,40 @@
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+from . import models
+from .ranking import hot_score_expr
+
+
+def reconcile_vote_counts(db: Session, batch_size: int = 10000) -> int:
+    """Recompute posts.vote_count from the votes table to repair drift.
+
+    hot_score is recomputed along with it, which also fills in scores for
+    posts loaded without one (e.g. by an import).
+
+    Posts are processed in id ranges of `batch_size`, one transaction per
+    range, so a full pass never holds row locks on the whole table.
+    Returns the number of posts whose counter was corrected.
+    """
+    # pylint: disable=not-callable
+    min_id, max_id = db.query(func.min(models.Post.id),
+                              func.max(models.Post.id)).one()
+    actual_count = select(func.count()).select_from(models.Vote).where(
+        models.Vote.post_id == models.Post.id).scalar_subquery()
+    # pylint: enable=not-callable
+    if min_id is None:
+        return 0
+    actual_score = hot_score_expr(db.get_bind().dialect.name,
+                                  actual_count, models.Post.created_at)
+
+    corrected = 0
+    for start in range(min_id, max_id + 1, batch_size):
+        result = db.query(models.Post).filter(
+            models.Post.id >= start,
+            models.Post.id < start + batch_size,
+            or_(models.Post.vote_count != actual_count,
+                models.Post.hot_score != actual_score),
+        ).update({models.Post.vote_count: actual_count,
+                  models.Post.hot_score: actual_score},
+                 synchronize_session=False)
+        db.commit()
+        corrected += result
+    return corrected
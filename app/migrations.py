@@ -0,0 +1,93 @@
+"""Alembic helpers for the startup schema check and `manage.py migrate`.
+
+Startup only asks the database for its current revision (one query) and
+compares it with the heads of the migration scripts on disk. Upgrading is
+left to `python manage.py migrate`, or done at startup when AUTO_MIGRATE is
+on, in which case a PostgreSQL advisory lock makes sure only one of several
+booting workers runs the migrations.
+"""
+import os
+from contextlib import contextmanager
+from typing import Optional, Set
+from alembic import command
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+
+# Get the project root directory (where alembic.ini is located)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALEMBIC_INI_PATH = os.path.join(PROJECT_ROOT, "alembic.ini")
+# Arbitrary application-wide key for pg_advisory_lock
+MIGRATION_LOCK_KEY = 0x736F6369616C
+
+
+def alembic_config(connection: Optional[Connection] = None) -> Config:
+    """Alembic config; env.py runs on `connection` instead of its own engine."""
+    config = Config(ALEMBIC_INI_PATH)
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def head_revisions() -> Set[str]:
+    """Head revisions of the migration scripts on disk."""
+    return set(ScriptDirectory.from_config(alembic_config()).get_heads())
+
+
+def current_revisions(connection: Connection) -> Set[str]:
+    """Revisions recorded in alembic_version, or none if it doesn't exist yet."""
+    try:
+        revisions = set(connection.execute(
+            text("SELECT version_num FROM alembic_version")).scalars())
+    except DBAPIError:
+        revisions = set()
+    connection.rollback()
+    return revisions
+
+
+def is_at_head(connection: Connection) -> bool:
+    return current_revisions(connection) == head_revisions()
+
+
+@contextmanager
+def advisory_lock(connection: Connection):
+    """Hold a session-level PostgreSQL advisory lock for the block."""
+    if connection.dialect.name != "postgresql":
+        yield
+        return
+    connection.execute(text("SELECT pg_advisory_lock(:key)"),
+                       {"key": MIGRATION_LOCK_KEY})
+    connection.commit()
+    try:
+        yield
+    finally:
+        connection.rollback()
+        connection.execute(text("SELECT pg_advisory_unlock(:key)"),
+                           {"key": MIGRATION_LOCK_KEY})
+        connection.commit()
+
+
+def upgrade(connection: Connection, revision: str = "head"):
+    """Run migrations up to `revision` on an existing connection."""
+    command.upgrade(alembic_config(connection), revision)
+    connection.commit()
+
+
+def ensure_schema(engine: Engine, auto_migrate: bool) -> str:
+    """Check the schema is at head, upgrading it first if auto_migrate is set.
+
+    Returns a short description of what happened, for the startup log.
+    """
+    with engine.connect() as connection:
+        if is_at_head(connection):
+            return "is at head"
+        if not auto_migrate:
+            return "is behind head; run `python manage.py migrate`"
+        with advisory_lock(connection):
+            # Another worker may have migrated while we waited for the lock
+            if is_at_head(connection):
+                return "was upgraded to head by another worker"
+            upgrade(connection)
+        return "was upgraded to head"
@@ -1,5 +1,6 @@
 from .database import Base
-from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, text, ForeignKey
+from sqlalchemy import (Column, Integer, String, Boolean, Float, TIMESTAMP, text,
+                        ForeignKey, Index)
 from sqlalchemy.orm import relationship
 
 
@@ -16,8 +17,18 @@ class Post(Base):
                         nullable=False, server_default=text('now()'))
     owner_id = Column(Integer, ForeignKey(
         "users.id", ondelete="CASCADE"), nullable=False)
+    vote_count = Column(Integer, server_default='0', nullable=False)
+    # app.ranking.hot_score(vote_count, created_at), kept up to date by votes
+    hot_score = Column(Float, server_default='0', nullable=False)
     owner = relationship("User", back_populates="posts")
 
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_vote_count_id", "vote_count", "id"),
+        Index("ix_posts_hot_score_id", "hot_score", "id"),
+        Index("ix_posts_owner_id_created_at_id", "owner_id", "created_at", "id"),
+    )
+
 
 class User(Base):
     __tablename__ = "users"
@@ -0,0 +1,84 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Tuple, Union
+from fastapi import HTTPException, status
+
+
+# Most ids a multi-get (?ids=1,2,3) may ask for
+MAX_IDS = 100
+
+
+def _invalid_cursor() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid cursor",
+    )
+
+
+def _encode(key: list) -> str:
+    payload = json.dumps(key).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> list:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded))
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    """Encode the sort key of the last row of a page into an opaque cursor."""
+    return _encode([created_at.isoformat(), id])
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor back into its sort key."""
+    try:
+        created_at, id = _decode(cursor)
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError):
+        raise _invalid_cursor()
+
+
+def encode_ranked_cursor(sort: str, score: Union[int, float], id: int) -> str:
+    """Encode the (score, id) sort key of the last row of a ranked page."""
+    return _encode([sort, score, id])
+
+
+def decode_ranked_cursor(cursor: str, sort: str) -> Tuple[Union[int, float], int]:
+    """Decode a cursor produced by encode_ranked_cursor for the same sort."""
+    try:
+        cursor_sort, score, id = _decode(cursor)
+        if (cursor_sort != sort or isinstance(score, bool)
+                or not isinstance(score, (int, float))):
+            raise ValueError(cursor)
+        return score, int(id)
+    except (ValueError, TypeError):
+        raise _invalid_cursor()
+
+
+def encode_id_cursor(id: int) -> str:
+    """Encode the id of the last row of a page ordered by id alone."""
+    return _encode([id])
+
+
+def decode_id_cursor(cursor: str) -> int:
+    """Decode a cursor produced by encode_id_cursor back into the id."""
+    try:
+        (id,) = _decode(cursor)
+        return int(id)
+    except (ValueError, TypeError):
+        raise _invalid_cursor()
+
+
+def parse_ids(ids: str) -> List[int]:
+    """Parse a comma-separated `ids` parameter, keeping order, minus repeats."""
+    try:
+        parsed = list(dict.fromkeys(int(id) for id in ids.split(",") if id.strip()))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="ids must be comma-separated integers")
+    if len(parsed) > MAX_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {MAX_IDS} ids per request")
+    return parsed
@@ -0,0 +1,78 @@
+"""Connection pool statistics and background liveness checks.
+
+With DB_PRE_PING=background, connections are not pinged on every checkout.
+Instead a loop started with the app pings the idle ones every
+DB_LIVENESS_INTERVAL_SECONDS. A ping that finds a dead connection makes
+SQLAlchemy invalidate the whole pool, so after a database restart the
+stale connections are replaced within one interval rather than failing
+requests one by one. A request can still meet a connection that died since
+the last pass; that is the trade-off for saving a round trip per checkout.
+The loop covers the serving engine only; read replica engines keep pinging
+on checkout.
+"""
+import asyncio
+import logging
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+def pool_stats(engine: Engine) -> dict:
+    """Current occupancy and checkout wait totals of an engine's pool."""
+    pool = engine.pool
+    wait_count = getattr(pool, "wait_count", 0)
+    wait_total = getattr(pool, "wait_seconds_total", 0.0)
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "waiting": getattr(pool, "waiting", 0),
+        # Negative while the pool hasn't opened `size` connections yet
+        "overflow": pool.overflow(),
+        "max_overflow": getattr(pool, "_max_overflow", None),
+        "timeout_seconds": pool.timeout(),
+        "pre_ping": pool._pre_ping,  # pylint: disable=protected-access
+        "checkouts": wait_count,
+        "wait_seconds_total": round(wait_total, 6),
+        "wait_seconds_avg": round(wait_total / wait_count, 6) if wait_count else 0.0,
+        "wait_seconds_max": round(getattr(pool, "wait_seconds_max", 0.0), 6),
+    }
+
+
+def ping_idle_connections(engine: Engine) -> int:
+    """Ping each connection idle in the pool once; return how many were pinged.
+
+    QueuePool hands connections out first-in first-out, so checking out and
+    returning one connection `checkedin()` times visits each idle one.
+    """
+    pinged = 0
+    for _ in range(engine.pool.checkedin()):
+        with engine.connect() as conn:
+            conn.exec_driver_sql("SELECT 1")
+        pinged += 1
+    return pinged
+
+
+async def ping_idle_connections_async(engine: AsyncEngine) -> int:
+    """ping_idle_connections for the asyncio engine."""
+    pinged = 0
+    for _ in range(engine.pool.checkedin()):
+        async with engine.connect() as conn:
+            await conn.exec_driver_sql("SELECT 1")
+        pinged += 1
+    return pinged
+
+
+async def liveness_loop(engine, interval: float):
+    """Ping idle connections of a sync or async engine every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if isinstance(engine, AsyncEngine):
+                await ping_idle_connections_async(engine)
+            else:
+                await run_in_threadpool(ping_idle_connections, engine)
+        except Exception:
+            logger.warning("Connection liveness check failed", exc_info=True)
@@ -0,0 +1,39 @@
+"""Hot ranking score for posts.
+
+The score is log10 of the vote count (at least 1) plus the post's age
+bonus: every HOT_DECAY_SECONDS of newer creation time is worth a tenfold
+increase in votes. The age term is fixed at creation, so scores never need
+to decay over time; they only change when votes do. That lets
+posts.hot_score be stored, indexed and maintained incrementally by the vote
+writes, with `manage.py reconcile-votes` recomputing it to repair drift.
+
+PostgreSQL computes the score in SQL; SQLite calls hot_score(), registered
+on every connection by app.database.
+"""
+import math
+from datetime import datetime, timezone
+from typing import Union
+from sqlalchemy import func
+
+HOT_EPOCH = 1134028003
+HOT_DECAY_SECONDS = 45000
+
+
+def hot_score(votes: int, created_at: Union[datetime, str]) -> float:
+    """Score of a post with `votes` votes created at `created_at` (UTC if naive)."""
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return (math.log10(max(votes, 1))
+            + (created_at.timestamp() - HOT_EPOCH) / HOT_DECAY_SECONDS)
+
+
+def hot_score_expr(dialect_name: str, votes, created_at):
+    """SQL expression computing hot_score() from column expressions."""
+    # pylint: disable=not-callable
+    if dialect_name == "postgresql":
+        return (func.log(func.greatest(votes, 1))
+                + (func.extract("epoch", created_at) - HOT_EPOCH) / HOT_DECAY_SECONDS)
+    return func.hot_score(votes, created_at)
+    # pylint: enable=not-callable
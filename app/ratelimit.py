@@ -0,0 +1,208 @@
+"""Rate limiting and load shedding.
+
+RateLimitMiddleware charges every request against a token bucket per
+client: the user id of a valid bearer token, or the client address. Buckets
+hold up to RATE_LIMIT_BURST tokens and refill at RATE_LIMIT_PER_SECOND.
+Expensive routes cost more than one token (ROUTE_COSTS), so a client can't
+spend its whole budget on Argon2 logins or full-text searches. A request
+that can't pay gets 429 with Retry-After. Buckets live in process memory,
+or in Redis when RATE_LIMIT_REDIS_URL is set so all workers share them.
+
+LoadShedMiddleware answers 503 straight away while LOAD_SHED_POOL_WAITERS
+or more requests are already queued for a database connection, instead of
+letting new requests join the queue and time out after DB_POOL_TIMEOUT.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Tuple
+import orjson
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import HTTPConnection
+from .config import settings
+from .routers.oauth2 import token_user_id
+
+DEFAULT_COST = 1
+# (method, path) -> tokens; paths without their trailing slash
+ROUTE_COSTS: Dict[Tuple[str, str], float] = {
+    ("POST", "/login"): 10,
+    ("POST", "/users"): 10,
+    ("POST", "/votes/batch"): 5,
+}
+# GET /posts with a search term
+SEARCH_COST = 5
+# Monitoring endpoints are never limited or shed
+EXEMPT_PATHS = frozenset({"/metrics", "/health/pool"})
+
+
+def request_cost(connection: HTTPConnection) -> float:
+    method, path = connection.scope["method"], connection.url.path.rstrip("/")
+    if method == "GET" and path == "/posts" and connection.query_params.get("search"):
+        return SEARCH_COST
+    return ROUTE_COSTS.get((method, path), DEFAULT_COST)
+
+
+def rate_limit_key(connection: HTTPConnection) -> str:
+    """The user id of a valid bearer token, else the client address.
+
+    The signature is checked so forged tokens can't mint fresh buckets.
+    """
+    scheme, _, token = connection.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        user_id = token_user_id(token)
+        if user_id is not None:
+            return f"user:{user_id}"
+    return f"addr:{connection.client.host if connection.client else ''}"
+
+
+class RateLimitBackend:
+    """Token-bucket storage shared by RateLimitMiddleware."""
+
+    # Whether take() waits on the network; the middleware then calls it from
+    # the threadpool rather than the event loop
+    blocking = False
+
+    def take(self, key: str, cost: float, burst: float,
+             per_second: float) -> Tuple[bool, float]:
+        """Spend `cost` tokens from key's bucket.
+
+        Returns whether the request is allowed and, if not, how many seconds
+        until enough tokens have been refilled.
+        """
+        raise NotImplementedError
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """Per-process buckets, least recently used dropped beyond `max_keys`."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, burst: float,
+             per_second: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * per_second)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / per_second
+
+
+# Refill and spend atomically in Redis; tokens are returned as a string
+# because Redis truncates Lua numbers to integers
+_TAKE_SCRIPT = """
+local burst = tonumber(ARGV[1])
+local per_second = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * per_second)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / per_second * 1000))
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """Buckets in Redis, shared by every worker."""
+
+    blocking = True
+
+    def __init__(self, client, prefix: str = "fastapi_sm:ratelimit:"):
+        self.prefix = prefix
+        self._take = client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key: str, cost: float, burst: float,
+             per_second: float) -> Tuple[bool, float]:
+        allowed, tokens = self._take(keys=[self.prefix + key],
+                                     args=[burst, per_second, cost, time.time()])
+        if allowed:
+            return True, 0.0
+        return False, (cost - float(tokens)) / per_second
+
+
+def backend_from_settings() -> RateLimitBackend:
+    if not settings.rate_limit_redis_url:
+        return MemoryRateLimitBackend()
+    try:
+        import redis  # pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        raise RuntimeError(
+            "RATE_LIMIT_REDIS_URL is set but the 'redis' package is not installed"
+        ) from exc
+    return RedisRateLimitBackend(redis.Redis.from_url(settings.rate_limit_redis_url))
+
+
+async def _send_json(send, status: int, detail: str, retry_after: int):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"),
+                    (b"retry-after", str(retry_after).encode())],
+    })
+    await send({"type": "http.response.body", "body": orjson.dumps({"detail": detail})})
+
+
+class RateLimitMiddleware:
+    """Reject requests from clients that have run out of tokens with 429."""
+
+    def __init__(self, app, backend: Optional[RateLimitBackend] = None,
+                 burst: Optional[float] = None, per_second: Optional[float] = None):
+        self.app = app
+        self.backend = backend or backend_from_settings()
+        self.burst = burst if burst is not None else settings.rate_limit_burst
+        self.per_second = (per_second if per_second is not None
+                           else settings.rate_limit_per_second)
+
+    def _take(self, connection: HTTPConnection) -> Tuple[bool, float]:
+        return self.backend.take(rate_limit_key(connection), request_cost(connection),
+                                 self.burst, self.per_second)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+        connection = HTTPConnection(scope)
+        if self.backend.blocking:
+            # rate_limit_key may look up the shared revocation list too
+            allowed, retry_after = await run_in_threadpool(self._take, connection)
+        else:
+            allowed, retry_after = self._take(connection)
+        if not allowed:
+            await _send_json(send, 429, "Too many requests",
+                             max(1, math.ceil(retry_after)))
+            return
+        await self.app(scope, receive, send)
+
+
+class LoadShedMiddleware:
+    """Answer 503 at once while the connection pool queue is saturated."""
+
+    def __init__(self, app, pools: Callable[[], Iterable], max_waiters: int):
+        self.app = app
+        # Called per request, so the engines can be created lazily
+        self.pools = pools
+        self.max_waiters = max_waiters
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] == "http" and scope["path"] not in EXEMPT_PATHS
+                and sum(getattr(pool, "waiting", 0) for pool in self.pools())
+                >= self.max_waiters):
+            await _send_json(send, 503, "Server busy, please retry shortly", 1)
+            return
+        await self.app(scope, receive, send)
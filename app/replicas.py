@@ -0,0 +1,112 @@
+"""Routing of read-only requests to read replicas.
+
+GET endpoints take their session from get_read_db (or get_read_async_db),
+which picks the app's replicas, configured in DATABASE_REPLICA_URLS, round
+robin and falls back to the primary when there are none.
+
+Read-your-writes: ReadYourWritesMiddleware notes every client whose write
+request (POST, PUT, PATCH, DELETE) succeeded, and for the next
+READ_YOUR_WRITES_SECONDS that client's reads go to the primary, so a post
+shows up in the author's feed straight after it was created regardless of
+replica lag. Clients are identified by the user id in their bearer token,
+or by address when unauthenticated. The marks live in a TTLCache, shared
+across workers when CACHE_REDIS_URL is set.
+"""
+from typing import Callable
+from fastapi import Request
+from starlette.requests import HTTPConnection
+from jose import JWTError, jwt
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from .cache import TTLCache, backend_from_settings
+from .config import settings
+
+WRITE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+recent_writers = TTLCache(
+    "recent-writers",
+    max_size=settings.user_cache_max_size,
+    ttl=settings.read_your_writes_seconds,
+    backend=backend_from_settings(),
+)
+
+
+def client_key(connection: HTTPConnection) -> str:
+    """Identify the client of a request for read-your-writes routing."""
+    authorization = connection.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            # Only used for routing, where a forged token gains nothing but
+            # reads from the primary, so the signature isn't checked here
+            user_id = jwt.get_unverified_claims(token).get("user_id")
+        except JWTError:
+            user_id = None
+        if user_id is not None:
+            return f"user:{user_id}"
+    return f"addr:{connection.client.host if connection.client else ''}"
+
+
+def wrote_recently(request: Request) -> bool:
+    return recent_writers.get(client_key(request)) is not None
+
+
+async def off_event_loop(fn, *args):
+    """Call fn in the threadpool when recent_writers may wait on Redis."""
+    if recent_writers.backend is None:
+        return fn(*args)
+    return await run_in_threadpool(fn, *args)
+
+
+def read_session_factory(request: Request) -> Callable[[], Session]:
+    """The sessionmaker a read-only request should use."""
+    database = request.app.state.database
+    if not database.replica_urls or wrote_recently(request):
+        return database.session_factory
+    return database.next_replica_session_factory()
+
+
+def get_read_db(request: Request):
+    """Database dependency for read-only endpoints."""
+    db = read_session_factory(request)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def async_read_session_factory(request: Request):
+    """The async_sessionmaker a read-only request should use."""
+    database = request.app.state.database
+    if not database.replica_urls or wrote_recently(request):
+        return database.async_session_factory
+    return database.next_async_replica_session_factory()
+
+
+async def get_read_async_db(request: Request):
+    """get_read_db for the routers in app.routers.aio."""
+    session_factory = await off_event_loop(async_read_session_factory, request)
+    async with session_factory() as db:
+        yield db
+
+
+class ReadYourWritesMiddleware:
+    """Pin clients to the primary for a while after a successful write."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_and_mark(message):
+            # Mark before the response leaves, so the client's next request
+            # can't overtake it
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                await off_event_loop(
+                    recent_writers.set, client_key(HTTPConnection(scope)), True)
+            await send(message)
+
+        await self.app(scope, receive, send_and_mark)
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.ext.asyncio import AsyncSession
+from ...database import get_async_db
+from ...schemas import Token
+from ...utils import hash_password_async, verify_password_async, needs_rehash
+from .. import auth as sync_auth
+
+router = APIRouter(
+    # prefix="/auth",
+    tags=["authentication"]
+)
+
+
+@router.post("/login", response_model=Token)
+async def login(user_credentials: OAuth2PasswordRequestForm = Depends(),
+                db: AsyncSession = Depends(get_async_db)):
+    user = await db.run_sync(sync_auth.find_user_by_email, user_credentials.username)
+    password_ok = await verify_password_async(
+        user_credentials.password, user.password)
+    if password_ok and needs_rehash(user.password):
+        hashed_password = await hash_password_async(user_credentials.password)
+        await db.run_sync(sync_auth.update_password_hash, user, hashed_password)
+    return sync_auth.issue_token(user, password_ok)
@@ -0,0 +1,104 @@
+from typing import List, Optional
+from fastapi import APIRouter, status, Depends, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from ...cache import deferred_invalidation
+from ...database import get_async_db
+from ...pagination import parse_ids
+from ...replicas import get_read_async_db
+from ...schemas import PostCreate, PostResponse, PostUpdate
+from ...serialization import FastJSONResponse, dump_json
+from ..oauth2 import get_current_user_async
+from .. import post as sync_post
+
+router = APIRouter(
+    prefix="/posts",
+    tags=["posts"]
+)
+
+
+@router.get("/", response_model=List[PostResponse])
+async def get_posts(request: Request, db: AsyncSession = Depends(get_read_async_db),
+                    current_user: int = Depends(get_current_user_async),
+                    limit: int = 10, skip: int = 0, search: Optional[str] = "",
+                    cursor: Optional[str] = None, sort: sync_post.PostSort = "new",
+                    ids: Optional[str] = None):
+    """List posts newest first, by votes (`top`) or by hot score (`hot`).
+
+    Searches are ordered by relevance and ignore `sort`. With `ids` (up to
+    100, comma-separated) just those posts are returned, in that order, and
+    the other parameters are ignored; unknown ids are left out.
+
+    Pass the X-Next-Cursor header of a page back as `cursor` to fetch the
+    next page with a keyset seek instead of an OFFSET scan; `skip` is only
+    honoured when no cursor is given. Search results are paged with `skip`.
+    Responses carry an ETag; send it back in If-None-Match to get a 304.
+    """
+    cached = await sync_post.post_response_cache.lookup_async(request)
+    if cached.response is not None:
+        return cached.response
+    if ids is not None:
+        posts = await db.run_sync(sync_post.read_posts, parse_ids(ids))
+        return cached.store(dump_json(posts))
+    posts, next_cursor = await db.run_sync(
+        sync_post.list_posts, limit, skip, search, cursor, sort)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return cached.store(dump_json(posts), headers)
+
+
+@router.get("/my-posts", response_model=List[PostResponse])
+async def get_my_posts(db: AsyncSession = Depends(get_read_async_db),
+                       current_user: int = Depends(get_current_user_async),
+                       limit: int = Query(10, ge=1, le=sync_post.MAX_POSTS_PAGE),
+                       cursor: Optional[str] = None):
+    """The current user's posts, newest first.
+
+    Pass the X-Next-Cursor header of a page back as `cursor` for the next one.
+    """
+    posts, next_cursor = await db.run_sync(
+        sync_post.list_user_posts, current_user.id, limit, cursor)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return FastJSONResponse(posts, headers=headers)
+
+
+@router.get("/{id}", response_model=PostResponse)
+async def get_post(id: int, request: Request,
+                   db: AsyncSession = Depends(get_read_async_db),
+                   current_user: int = Depends(get_current_user_async)):
+    cached = await sync_post.post_response_cache.lookup_async(request)
+    if cached.response is not None:
+        return cached.response
+    post = await db.run_sync(sync_post.read_post, id)
+    return cached.store(dump_json(post))
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=PostResponse)
+async def create_post(post: PostCreate, db: AsyncSession = Depends(get_async_db),
+                      current_user: int = Depends(get_current_user_async)):
+    async with deferred_invalidation():
+        new_post = await db.run_sync(sync_post.insert_post, post, current_user.id)
+    return FastJSONResponse(new_post, status_code=status.HTTP_201_CREATED)
+
+
+@router.put("/{id}", response_model=PostResponse)
+async def update_post(id: int, post: PostCreate,
+                      db: AsyncSession = Depends(get_async_db),
+                      current_user: int = Depends(get_current_user_async)):
+    async with deferred_invalidation():
+        updated_post = await db.run_sync(sync_post.replace_post, id, post, current_user)
+    return FastJSONResponse(updated_post)
+
+
+@router.patch("/{id}", response_model=PostResponse)
+async def modify_post(id: int, post: PostUpdate,
+                      db: AsyncSession = Depends(get_async_db),
+                      current_user: int = Depends(get_current_user_async)):
+    async with deferred_invalidation():
+        updated_post = await db.run_sync(sync_post.patch_post, id, post, current_user)
+    return FastJSONResponse(updated_post)
+
+
+@router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_post(id: int, db: AsyncSession = Depends(get_async_db),
+                      current_user: int = Depends(get_current_user_async)):
+    async with deferred_invalidation():
+        await db.run_sync(sync_post.remove_post, id, current_user.id)
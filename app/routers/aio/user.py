@@ -0,0 +1,69 @@
+from typing import AsyncIterator, List, Optional
+from fastapi import APIRouter, status, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from ...database import get_async_db
+from ...pagination import parse_ids
+from ...replicas import async_read_session_factory, get_read_async_db
+from ...schemas import UserCreate, UserResponse
+from ...serialization import FastJSONResponse
+from ...utils import hash_password_async
+from ..oauth2 import get_current_user_async
+from .. import user as sync_user
+
+router = APIRouter(
+    prefix="/users",
+    tags=["users"]
+)
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=UserResponse)
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    await db.run_sync(sync_user.ensure_email_available, user.email)
+    hashed_password = await hash_password_async(user.password)
+    return await db.run_sync(sync_user.insert_user, user.email, hashed_password)
+
+
+async def stream_users(query, session_factory) -> AsyncIterator[bytes]:
+    """Async counterpart of user.stream_users, with its own session."""
+    query = query.execution_options(yield_per=sync_user.STREAM_BATCH_SIZE)
+    async with session_factory() as db:
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            yield sync_user.ndjson_chunk(rows)
+
+
+@router.get("/", response_model=List[UserResponse])
+async def get_users(request: Request, db: AsyncSession = Depends(get_read_async_db),
+                    limit: int = Query(100, ge=1, le=sync_user.MAX_USERS_PAGE),
+                    cursor: Optional[str] = None, stream: bool = False,
+                    ids: Optional[str] = None):
+    """List users by id, one page at a time.
+
+    Pass the X-Next-Cursor header of a page back as `cursor` to fetch the
+    next one. With `stream=true` every user after `cursor` is streamed as
+    newline-delimited JSON instead and `limit` is ignored. With `ids` (up to
+    100, comma-separated) just those users are returned, in that order;
+    unknown ids are left out.
+    """
+    if ids is not None:
+        users = await db.run_sync(sync_user.read_users, parse_ids(ids))
+        return FastJSONResponse(users)
+    if stream:
+        return StreamingResponse(
+            stream_users(sync_user.users_after(cursor),
+                         async_read_session_factory(request)),
+            media_type=sync_user.NDJSON_MEDIA_TYPE)
+    users, next_cursor = await db.run_sync(sync_user.list_users, limit, cursor)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return FastJSONResponse(users, headers=headers)
+
+
+@router.get("/logged-in-user", response_model=UserResponse)
+async def get_logged_in_user(current_user: int = Depends(get_current_user_async)):
+    return current_user
+
+
+@router.get('/{id}', response_model=UserResponse)
+async def get_user(id: int, db: AsyncSession = Depends(get_read_async_db)):
+    return await db.run_sync(sync_user.read_user, id)
@@ -0,0 +1,34 @@
+from typing import List
+from fastapi import APIRouter, status, Depends, Response, Body
+from sqlalchemy.ext.asyncio import AsyncSession
+from ...cache import deferred_invalidation
+from ...database import get_async_db
+from ...schemas import Vote, VoteResult, VoteBatchResult
+from ..oauth2 import get_current_user_async
+from .. import vote as sync_vote
+
+router = APIRouter(
+    prefix="/votes",
+    tags=["votes"]
+)
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=VoteResult)
+async def vote(vote: Vote, response: Response, db: AsyncSession = Depends(get_async_db),
+               current_user: int = Depends(get_current_user_async)):
+    """Set the caller's vote on a post; 200 instead of 201 when nothing changed."""
+    async with deferred_invalidation():
+        result = await db.run_sync(sync_vote.apply_vote, vote, current_user.id)
+    if not result.changed:
+        response.status_code = status.HTTP_200_OK
+    return result
+
+
+@router.post("/batch", response_model=List[VoteBatchResult])
+async def vote_batch(votes: List[Vote] = Body(
+                         ..., max_length=sync_vote.MAX_BATCH_VOTES),
+                     db: AsyncSession = Depends(get_async_db),
+                     current_user: int = Depends(get_current_user_async)):
+    """Replay queued votes in one transaction and report the outcome of each."""
+    async with deferred_invalidation():
+        return await db.run_sync(sync_vote.apply_vote_batch, votes, current_user.id)
@@ -1,35 +1,62 @@
+import logging
 from fastapi import APIRouter, status, HTTPException, Depends
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from ..database import get_db
 from .. import models
 from ..schemas import UserLogin, Token
-from ..utils import hash_password, verify_password
+from ..utils import hash_password_async, verify_password_async, needs_rehash
 from .oauth2 import create_access_token
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     # prefix="/auth",
     tags=["authentication"]
 )
 
 
-@router.post("/login", response_model=Token)
-def login(user_credentials: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(
-        models.User.email == user_credentials.username).first()
+def find_user_by_email(db: Session, email: str) -> models.User:
+    """Load the user logging in, or raise 401."""
+    user = db.query(models.User).filter(models.User.email == email).first()
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
+    return user
+
+
+def update_password_hash(db: Session, user: models.User, hashed_password: str):
+    """Store a hash made with the current Argon2 parameters."""
+    user.password = hashed_password
+    db.commit()
 
-    if not verify_password(user_credentials.password, user.password):
-        print("Invalid credentials")
+
+def issue_token(user: models.User, password_ok: bool) -> dict:
+    """Turn a password check result into a bearer token response."""
+    if not password_ok:
+        logger.info("Failed login for user %s", user.id)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
 
-    print("Login successful")
+    logger.debug("Login successful for user %s", user.id)
     access_token = create_access_token(data={"user_id": user.id})
     return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.post("/login", response_model=Token)
+async def login(user_credentials: OAuth2PasswordRequestForm = Depends(),
+                db: Session = Depends(get_db)):
+    # async so the Argon2 wait doesn't hold a threadpool thread; only the
+    # queries run there
+    user = await run_in_threadpool(find_user_by_email, db, user_credentials.username)
+    password_ok = await verify_password_async(
+        user_credentials.password, user.password)
+    if password_ok and needs_rehash(user.password):
+        hashed_password = await hash_password_async(user_credentials.password)
+        await run_in_threadpool(update_password_hash, db, user, hashed_password)
+    return issue_token(user, password_ok)
@@ -1,10 +1,16 @@
+import hashlib
+import time
+from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from ..schemas import TokenData
-from sqlalchemy.orm import Session
-from ..database import get_db
+from ..schemas import TokenData, UserResponse
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_db, get_async_db
 from .. import models
+from ..cache import TTLCache, backend_from_settings
 from ..config import settings
 from datetime import datetime, timedelta
 
@@ -13,6 +19,85 @@ ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# Resolved users by id, so authenticated requests skip the users table
+user_cache = TTLCache(
+    "user",
+    max_size=settings.user_cache_max_size,
+    ttl=settings.user_cache_ttl_seconds,
+    backend=backend_from_settings(),
+    dumps=lambda user: user.model_dump_json().encode(),
+    loads=UserResponse.model_validate_json,
+)
+
+
+# Decoded claims by token digest, so each token's signature is checked once
+# per worker rather than on every request. Local only: claims are cheap to
+# recompute and a shared copy would let a leaked Redis forge sessions.
+token_cache = TTLCache(
+    "token",
+    max_size=settings.token_cache_max_size,
+    ttl=settings.token_cache_ttl_seconds,
+)
+# Digests of revoked tokens, kept until the tokens would have expired anyway
+revoked_tokens = TTLCache(
+    "revoked-token",
+    max_size=settings.token_cache_max_size,
+    ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    backend=backend_from_settings(),
+)
+
+
+def token_digest(token: str) -> str:
+    return hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+
+
+def decode_token(token: str) -> dict:
+    """Claims of a valid, unexpired and unrevoked token; raises JWTError otherwise."""
+    digest = token_digest(token)
+    claims = token_cache.get(digest)
+    if claims is None:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        # Only after the signature checks out, so junk tokens can't make
+        # a round trip to the shared revocation list
+        if revoked_tokens.get(digest) is not None:
+            raise JWTError("Token has been revoked")
+        token_cache.set(digest, claims)
+    elif claims.get("exp") is not None and claims["exp"] <= time.time():
+        token_cache.delete(digest)
+        raise JWTError("Signature has expired.")
+    return claims
+
+
+def revoke_token(token: str):
+    """Reject `token` from now on, e.g. on logout or a password change.
+
+    Takes effect at once on this worker and within TOKEN_CACHE_TTL_SECONDS
+    on the others.
+    """
+    digest = token_digest(token)
+    revoked_tokens.set(digest, True)
+    token_cache.delete(digest)
+
+
+def token_user_id(token: str) -> Optional[int]:
+    """The user id of a valid token, or None."""
+    try:
+        return decode_token(token).get("user_id")
+    except JWTError:
+        return None
+
+
+def cached_user_key(db, user_id: int) -> str:
+    """user_cache key of a user, scoped to the database the session is on."""
+    return f"{db.info['database'].key}:{user_id}"
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def invalidate_cached_user(mapper, connection, target):
+    """Drop a user from the cache whenever the row changes."""
+    user_cache.delete(cached_user_key(object_session(target), target.id))
+
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -24,7 +109,7 @@ def create_access_token(data: dict):
 
 def verify_token(token: str, credentials_exception):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         id: int = payload.get("user_id")
         if id is None:
             raise credentials_exception
@@ -34,12 +119,53 @@ def verify_token(token: str, credentials_exception):
         raise credentials_exception
 
 
+def _credentials_exception() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                         detail="Could not validate credentials",
+                         headers={"WWW-Authenticate": "Bearer"})
+
+
+def _user_response(db_user: models.User) -> UserResponse:
+    return UserResponse.model_construct(
+        id=db_user.id, email=db_user.email,
+        created_at=db_user.created_at, updated_at=db_user.updated_at)
+
+
+def _cache_user(db, db_user: models.User) -> UserResponse:
+    user = _user_response(db_user)
+    user_cache.set(cached_user_key(db, db_user.id), user)
+    return user
+
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
-                                          detail="Could not validate credentials",
-                                          headers={"WWW-Authenticate": "Bearer"})
+    credentials_exception = _credentials_exception()
     token = verify_token(token, credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token.id).first()
+    user_id = int(token.id)
+    user = user_cache.get(cached_user_key(db, user_id))
+    if user is None:
+        db_user = db.query(models.User).filter(models.User.id == user_id).first()
+        if db_user is None:
+            raise credentials_exception
+        user = _cache_user(db, db_user)
 
     return user
     # return verify_token(token, credentials_exception)
+
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme),
+                                 db: AsyncSession = Depends(get_async_db)):
+    """get_current_user for the async routers."""
+    credentials_exception = _credentials_exception()
+    token = verify_token(token, credentials_exception)
+    user_id = int(token.id)
+    # With CACHE_REDIS_URL, local misses are looked up (and filled) in Redis
+    # from the threadpool rather than on the event loop
+    user = await user_cache.get_async(cached_user_key(db, user_id))
+    if user is None:
+        db_user = await db.get(models.User, user_id)
+        if db_user is None:
+            raise credentials_exception
+        user = _user_response(db_user)
+        await user_cache.set_async(cached_user_key(db, user_id), user)
+
+    return user
@@ -1,98 +1,168 @@
-from typing import List, Optional
-from fastapi import APIRouter, status, HTTPException, Depends
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from typing import List, Literal, Optional, Tuple
+from fastapi import APIRouter, status, HTTPException, Depends, Query, Request
+from sqlalchemy import delete, literal_column, tuple_, update
+from sqlalchemy.orm import Session, joinedload
+from ..cache import ResponseCache, backend_from_settings
+from ..config import settings
 from ..database import get_db
+from ..replicas import get_read_db
 from .. import models
-from ..schemas import PostCreate, PostResponse
+from ..schemas import PostCreate, PostResponse, PostUpdate, UserResponse
+from ..pagination import (encode_cursor, decode_cursor, encode_ranked_cursor,
+                          decode_ranked_cursor, parse_ids)
+from ..ranking import hot_score_expr
+from ..serialization import FastJSONResponse, dump_json, post_to_dict
+from ..search import (tokenize, uses_full_text, full_text_match, post_index,
+                      index_post, unindex_post)
 from .oauth2 import get_current_user
 router = APIRouter(
     prefix="/posts",
     tags=["posts"]
 )
 
+# Serialized GET /posts and GET /posts/{id} bodies; every post or vote write
+# invalidates them
+post_response_cache = ResponseCache(
+    "posts",
+    max_size=settings.response_cache_max_size,
+    ttl=settings.response_cache_ttl_seconds,
+    backend=backend_from_settings(),
+    # Replicas may lag a write; don't cache what they return meanwhile
+    settle_seconds=(settings.read_your_writes_seconds
+                    if settings.database_replica_urls else 0),
+    enabled=(settings.response_cache_enabled
+             if settings.response_cache_enabled is not None
+             else settings.cache_redis_url is not None),
+)
+
+
+MAX_POSTS_PAGE = 100
+
+PostSort = Literal["new", "top", "hot"]
+# Each ordering is a descending scan of an (key, id) index
+SORT_KEYS = {
+    "new": models.Post.created_at,
+    "top": models.Post.vote_count,
+    "hot": models.Post.hot_score,
+}
+
+
+# What PostResponse needs from the posts row, returned by updates
+RETURNED_COLUMNS = (models.Post.title, models.Post.content, models.Post.published,
+                    models.Post.id, models.Post.created_at, models.Post.owner_id,
+                    models.Post.vote_count)
+
+
+def to_post_response(post: models.Post) -> dict:
+    """Serialize a post whose owner has been loaded."""
+    return post_to_dict(post)
 
-@router.get("/", response_model=List[PostResponse])
-def get_posts(db: Session = Depends(get_db), current_user: int = Depends(get_current_user),
-              limit: int = 10, skip: int = 0, search: Optional[str] = ""):
-    # pylint: disable=not-callable
-    query = db.query(
-        models.Post,
-        func.coalesce(func.count(models.Vote.post_id), 0).label("votes")
-    ).outerjoin(models.Vote, models.Vote.post_id == models.Post.id)
-    # pylint: enable=not-callable
 
+def list_posts(db: Session, limit: int, skip: int, search: Optional[str],
+               cursor: Optional[str], sort: PostSort = "new"
+               ) -> Tuple[List[dict], Optional[str]]:
+    """Fetch one page of posts and the cursor of the page after it, if any."""
+    query = db.query(models.Post).options(joinedload(models.Post.owner))
+
+    sort_key = SORT_KEYS[sort]
+    order_by = [sort_key.desc(), models.Post.id.desc()]
+    ranked_ids = None
+    next_cursor = None
     if search:
-        query = query.filter(
-            models.Post.title.ilike(f"%{search}%") |
-            models.Post.content.ilike(f"%{search}%")
-        )
+        terms = tokenize(search)
+        if not terms:
+            return [], None
+        if uses_full_text(db):
+            match, rank = full_text_match(terms)
+            query = query.filter(match)
+            order_by.insert(0, rank.desc())
+        else:
+            ranked_ids = post_index(db).search(db, terms)[skip:skip + limit]
+            query = query.filter(models.Post.id.in_(ranked_ids))
+            skip = 0
+    elif cursor:
+        if sort == "new":
+            after, post_id = decode_cursor(cursor)
+        else:
+            after, post_id = decode_ranked_cursor(cursor, sort)
+        query = query.filter(tuple_(sort_key, models.Post.id) < (after, post_id))
+        skip = 0
 
-    results = query.group_by(models.Post.id).limit(limit).offset(skip).all()
-    posts_with_votes = []
-    for post, vote_count in results:
-        post_dict = {
-            "id": post.id,
-            "title": post.title,
-            "content": post.content,
-            "published": post.published,
-            "created_at": post.created_at,
-            "owner_id": post.owner_id,
-            "owner": post.owner,
-            "votes": vote_count or 0
-        }
-        posts_with_votes.append(PostResponse(**post_dict))
-    return posts_with_votes
+    results = query.order_by(*order_by).limit(limit).offset(skip).all()
+    if ranked_ids is not None:
+        position = {post_id: i for i, post_id in enumerate(ranked_ids)}
+        results.sort(key=lambda post: position[post.id])
+    elif not search and limit > 0 and len(results) == limit:
+        last = results[-1]
+        if sort == "new":
+            next_cursor = encode_cursor(last.created_at, last.id)
+        else:
+            next_cursor = encode_ranked_cursor(
+                sort, getattr(last, sort_key.key), last.id)
 
+    return [to_post_response(post) for post in results], next_cursor
 
-@router.get("/my-posts", response_model=List[PostResponse])
-def get_my_posts(db: Session = Depends(get_db), current_user: int = Depends(get_current_user)):
-    posts = db.query(models.Post).filter(
-        models.Post.owner_id == current_user.id).all()
-    return posts
 
+def list_user_posts(db: Session, owner_id: int, limit: int, cursor: Optional[str]
+                    ) -> Tuple[List[dict], Optional[str]]:
+    """One page of an author's posts, newest first, and the next page's cursor.
 
-@router.get("/{id}", response_model=PostResponse)
-def get_post(id: int, db: Session = Depends(get_db), current_user: int = Depends(get_current_user)):
-    # pylint: disable=not-callable
-    result = db.query(
-        models.Post,
-        func.coalesce(func.count(models.Vote.post_id), 0).label("votes")
-    ).outerjoin(models.Vote, models.Vote.post_id == models.Post.id).filter(
-        models.Post.id == id
-    ).group_by(models.Post.id).first()
-    # pylint: enable=not-callable
-
-    if result is None:
+    A range scan of ix_posts_owner_id_created_at_id.
+    """
+    query = db.query(models.Post).options(joinedload(models.Post.owner)).filter(
+        models.Post.owner_id == owner_id)
+    if cursor:
+        query = query.filter(tuple_(models.Post.created_at, models.Post.id)
+                             < decode_cursor(cursor))
+    posts = query.order_by(models.Post.created_at.desc(),
+                           models.Post.id.desc()).limit(limit).all()
+    next_cursor = None
+    if len(posts) == limit:
+        next_cursor = encode_cursor(posts[-1].created_at, posts[-1].id)
+    return [to_post_response(post) for post in posts], next_cursor
+
+
+def read_post(db: Session, id: int) -> dict:
+    post = db.query(models.Post).options(joinedload(models.Post.owner)).filter(
+        models.Post.id == id).first()
+
+    if post is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Post with id: {id} not found",
         )
+    return to_post_response(post)
 
-    post, vote_count = result
-    post_dict = {
-        "id": post.id,
-        "title": post.title,
-        "content": post.content,
-        "published": post.published,
-        "created_at": post.created_at,
-        "owner_id": post.owner_id,
-        "owner": post.owner,
-        "votes": vote_count or 0
-    }
-    return PostResponse(**post_dict)
 
+def read_posts(db: Session, ids: List[int]) -> List[dict]:
+    """Posts with the given ids in one query, in the order asked.
 
-@router.post("/", status_code=status.HTTP_201_CREATED, response_model=PostResponse)
-def create_post(post: PostCreate, db: Session = Depends(get_db), current_user: int = Depends(get_current_user)):
+    Missing ids are skipped.
+    """
+    posts = db.query(models.Post).options(joinedload(models.Post.owner)).filter(
+        models.Post.id.in_(ids)).all()
+    by_id = {post.id: post for post in posts}
+    return [to_post_response(by_id[id]) for id in ids if id in by_id]
+
+
+def insert_post(db: Session, post: PostCreate, owner_id: int) -> dict:
     try:
         post_data = post.dict()
-        post_data['owner_id'] = current_user.id
+        post_data['owner_id'] = owner_id
         new_post = models.Post(**post_data)
+        # Scored from now() in the INSERT. On PostgreSQL that is the
+        # transaction time, the same value the created_at default gets; on
+        # SQLite the registered now() runs once per use, so the two can differ
+        # by microseconds, far below HOT_DECAY_SECONDS. The literal avoids
+        # func.now(), which SQLite renders as second-precision CURRENT_TIMESTAMP
+        new_post.hot_score = hot_score_expr(
+            db.get_bind().dialect.name, 0, literal_column("now()"))
         db.add(new_post)
         db.commit()
         db.refresh(new_post)
-        return new_post
+        index_post(db, new_post)
+        post_response_cache.invalidate()
+        return to_post_response(new_post)
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -101,41 +171,140 @@ def create_post(post: PostCreate, db: Session = Depends(get_db), current_user: i
         )
 
 
-@router.put("/{id}", response_model=PostResponse)
-def update_post(id: int, post: PostCreate, db: Session = Depends(get_db), current_user: int = Depends(get_current_user)):
-    post_query = db.query(models.Post).filter(models.Post.id == id)
-    updated_post = post_query.first()
-
-    if updated_post is None:
+def refuse_write(db: Session, id: int):
+    """Raise 404 or 403 for an owner-checked write that matched no row."""
+    db.rollback()
+    if db.query(models.Post.id).filter(models.Post.id == id).first() is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Post with id: {id} not found",
         )
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Not authorized to perform requested action",
+    )
+
+
+def update_owned_post(db: Session, id: int, values: dict, owner: UserResponse) -> dict:
+    """Write `values` to a post of `owner` with one UPDATE ... RETURNING.
+
+    Ownership is part of the WHERE clause, so it can't change between the
+    check and the write; only when no row matched is the post looked up
+    again to tell a missing post from someone else's.
+    """
+    statement = (
+        update(models.Post)
+        .where(models.Post.id == id, models.Post.owner_id == owner.id)
+        .values(**values, updated_at=literal_column("now()"))
+        .returning(*RETURNED_COLUMNS)
+        .execution_options(synchronize_session=False)
+    )
+    updated_post = db.execute(statement).first()
+    if updated_post is None:
+        refuse_write(db, id)
+    db.commit()
+    if "title" in values or "content" in values:
+        index_post(db, updated_post)
+    post_response_cache.invalidate()
+    return post_to_dict(updated_post, owner)
+
+
+def replace_post(db: Session, id: int, post: PostCreate, owner: UserResponse) -> dict:
+    return update_owned_post(db, id, post.model_dump(), owner)
+
 
-    if updated_post.owner_id != current_user.id:
+def patch_post(db: Session, id: int, post: PostUpdate, owner: UserResponse) -> dict:
+    """Update only the fields sent in the request body; nulls are ignored."""
+    values = post.model_dump(exclude_unset=True, exclude_none=True)
+    if not values:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to perform requested action",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No fields to update",
         )
-    post_query.update(post.dict(), synchronize_session=False)
+    return update_owned_post(db, id, values, owner)
+
+
+def remove_post(db: Session, id: int, owner_id: int):
+    statement = (
+        delete(models.Post)
+        .where(models.Post.id == id, models.Post.owner_id == owner_id)
+        .returning(models.Post.id)
+        .execution_options(synchronize_session=False)
+    )
+    if db.execute(statement).first() is None:
+        refuse_write(db, id)
     db.commit()
-    db.refresh(updated_post)
-    return updated_post
+    unindex_post(db, id)
+    post_response_cache.invalidate()
+
+
+@router.get("/", response_model=List[PostResponse])
+def get_posts(request: Request, db: Session = Depends(get_read_db),
+              current_user: int = Depends(get_current_user),
+              limit: int = 10, skip: int = 0, search: Optional[str] = "",
+              cursor: Optional[str] = None, sort: PostSort = "new",
+              ids: Optional[str] = None):
+    """List posts newest first, by votes (`top`) or by hot score (`hot`).
+
+    Searches are ordered by relevance and ignore `sort`. With `ids` (up to
+    100, comma-separated) just those posts are returned, in that order, and
+    the other parameters are ignored; unknown ids are left out.
+
+    Pass the X-Next-Cursor header of a page back as `cursor` to fetch the
+    next page with a keyset seek instead of an OFFSET scan; `skip` is only
+    honoured when no cursor is given. Search results are paged with `skip`.
+    Responses carry an ETag; send it back in If-None-Match to get a 304.
+    """
+    cached = post_response_cache.lookup(request)
+    if cached.response is not None:
+        return cached.response
+    if ids is not None:
+        return cached.store(dump_json(read_posts(db, parse_ids(ids))))
+    posts, next_cursor = list_posts(db, limit, skip, search, cursor, sort)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return cached.store(dump_json(posts), headers)
+
+
+@router.get("/my-posts", response_model=List[PostResponse])
+def get_my_posts(db: Session = Depends(get_read_db),
+                 current_user: int = Depends(get_current_user),
+                 limit: int = Query(10, ge=1, le=MAX_POSTS_PAGE),
+                 cursor: Optional[str] = None):
+    """The current user's posts, newest first.
+
+    Pass the X-Next-Cursor header of a page back as `cursor` for the next one.
+    """
+    posts, next_cursor = list_user_posts(db, current_user.id, limit, cursor)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return FastJSONResponse(posts, headers=headers)
+
+
+@router.get("/{id}", response_model=PostResponse)
+def get_post(id: int, request: Request, db: Session = Depends(get_read_db),
+             current_user: int = Depends(get_current_user)):
+    cached = post_response_cache.lookup(request)
+    if cached.response is not None:
+        return cached.response
+    return cached.store(dump_json(read_post(db, id)))
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=PostResponse)
+def create_post(post: PostCreate, db: Session = Depends(get_db), current_user: int = Depends(get_current_user)):
+    return FastJSONResponse(insert_post(db, post, current_user.id),
+                            status_code=status.HTTP_201_CREATED)
+
+
+@router.put("/{id}", response_model=PostResponse)
+def update_post(id: int, post: PostCreate, db: Session = Depends(get_db), current_user: int = Depends(get_current_user)):
+    return FastJSONResponse(replace_post(db, id, post, current_user))
+
+
+@router.patch("/{id}", response_model=PostResponse)
+def modify_post(id: int, post: PostUpdate, db: Session = Depends(get_db),
+                current_user: int = Depends(get_current_user)):
+    return FastJSONResponse(patch_post(db, id, post, current_user))
 
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_post(id: int, db: Session = Depends(get_db), current_user: int = Depends(get_current_user)):
-    post = db.query(models.Post).filter(models.Post.id == id).first()
-    if post is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Post with id: {id} not found",
-        )
-    if post.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Not authorized to perform requested action",
-        )
-    db.delete(post)
-    db.commit()
-    return post
+    remove_post(db, id, current_user.id)
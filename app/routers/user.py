@@ -1,10 +1,16 @@
-from typing import List
-from fastapi import APIRouter, status, HTTPException, Depends
+from typing import Iterator, List, Optional, Tuple
+from fastapi import APIRouter, status, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from ..database import get_db
 from .. import models
+from ..pagination import encode_id_cursor, decode_id_cursor, parse_ids
+from ..replicas import get_read_db, read_session_factory
 from ..schemas import UserCreate, UserResponse
-from ..utils import hash_password
+from ..serialization import FastJSONResponse, dump_json
+from ..utils import hash_password_async
 from .oauth2 import get_current_user
 
 router = APIRouter(
@@ -12,29 +18,34 @@ router = APIRouter(
     tags=["users"]
 )
 
+MAX_USERS_PAGE = 1000
+# Rows fetched per round trip, and per chunk written, when streaming
+STREAM_BATCH_SIZE = 1000
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
 
-@router.post("/", status_code=status.HTTP_201_CREATED, response_model=UserResponse)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
+# The UserResponse fields; selecting them directly skips building ORM objects
+USER_COLUMNS = (models.User.id, models.User.email,
+                models.User.created_at, models.User.updated_at)
+
+
+def ensure_email_available(db: Session, email: str):
+    """Raise 409 if a user is already registered with this email."""
+    existing_user = db.query(models.User).filter(
+        models.User.email == email).first()
+    if existing_user:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="User with this email already exists"
+        )
+
+
+def insert_user(db: Session, email: str, hashed_password: str) -> models.User:
     try:
-        # Check if user already exists
-        existing_user = db.query(models.User).filter(
-            models.User.email == user.email).first()
-        if existing_user:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="User with this email already exists"
-            )
-
-        # Hash the password
-        hashed_password = hash_password(user.password)
-
-        new_user = models.User(email=user.email, password=hashed_password)
+        new_user = models.User(email=email, password=hashed_password)
         db.add(new_user)
         db.commit()
         db.refresh(new_user)
         return new_user
-    except HTTPException:
-        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -43,19 +54,53 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
         )
 
 
-@router.get("/", response_model=List[UserResponse])
-def get_users(db: Session = Depends(get_db)):
-    users = db.query(models.User).all()
-    return users
+def users_after(cursor: Optional[str]):
+    """SELECT of user rows ordered by id, starting after the cursor."""
+    query = select(*USER_COLUMNS).order_by(models.User.id)
+    if cursor:
+        query = query.where(models.User.id > decode_id_cursor(cursor))
+    return query
 
 
-@router.get("/logged-in-user", response_model=UserResponse)
-def get_logged_in_user(current_user: int = Depends(get_current_user)):
-    return current_user
+def list_users(db: Session, limit: int,
+               cursor: Optional[str]) -> Tuple[List[dict], Optional[str]]:
+    """Fetch one page of users and the cursor of the page after it, if any."""
+    rows = db.execute(users_after(cursor).limit(limit)).all()
+    next_cursor = encode_id_cursor(rows[-1].id) if len(rows) == limit else None
+    return [row._asdict() for row in rows], next_cursor
 
 
-@router.get('/{id}', response_model=UserResponse)
-def get_user(id: int, db: Session = Depends(get_db)):
+def read_users(db: Session, ids: List[int]) -> List[dict]:
+    """Users with the given ids in one query, in the order asked.
+
+    Missing ids are skipped.
+    """
+    rows = db.execute(select(*USER_COLUMNS).where(models.User.id.in_(ids))).all()
+    by_id = {row.id: row._asdict() for row in rows}
+    return [by_id[id] for id in ids if id in by_id]
+
+
+def ndjson_chunk(rows) -> bytes:
+    return b"".join(dump_json(row._asdict()) + b"\n" for row in rows)
+
+
+def stream_users(query, session_factory) -> Iterator[bytes]:
+    """Yield the rows of a users_after() query as NDJSON, one batch at a time.
+
+    Rows come through a server-side cursor, so memory use doesn't depend on
+    the table size. The generator opens its own session: it runs after the
+    endpoint has returned, when request-scoped dependencies are closed.
+    """
+    query = query.execution_options(yield_per=STREAM_BATCH_SIZE)
+    db = session_factory()
+    try:
+        for rows in db.execute(query).partitions():
+            yield ndjson_chunk(rows)
+    finally:
+        db.close()
+
+
+def read_user(db: Session, id: int) -> models.User:
     user = db.query(models.User).filter(models.User.id == id).first()
     if user is None:
         raise HTTPException(
@@ -63,3 +108,46 @@ def get_user(id: int, db: Session = Depends(get_db)):
             detail=f"User with id: {id} not found",
         )
     return user
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=UserResponse)
+async def create_user(user: UserCreate, db: Session = Depends(get_db)):
+    # async for the same reason as auth.login: only the queries use the threadpool
+    await run_in_threadpool(ensure_email_available, db, user.email)
+    hashed_password = await hash_password_async(user.password)
+    return await run_in_threadpool(insert_user, db, user.email, hashed_password)
+
+
+@router.get("/", response_model=List[UserResponse])
+def get_users(request: Request, db: Session = Depends(get_read_db),
+              limit: int = Query(100, ge=1, le=MAX_USERS_PAGE),
+              cursor: Optional[str] = None, stream: bool = False,
+              ids: Optional[str] = None):
+    """List users by id, one page at a time.
+
+    Pass the X-Next-Cursor header of a page back as `cursor` to fetch the
+    next one. With `stream=true` every user after `cursor` is streamed as
+    newline-delimited JSON instead and `limit` is ignored. With `ids` (up to
+    100, comma-separated) just those users are returned, in that order;
+    unknown ids are left out.
+    """
+    if ids is not None:
+        return FastJSONResponse(read_users(db, parse_ids(ids)))
+    if stream:
+        # users_after() runs here so a bad cursor is a 400, not a broken stream
+        return StreamingResponse(
+            stream_users(users_after(cursor), read_session_factory(request)),
+            media_type=NDJSON_MEDIA_TYPE)
+    users, next_cursor = list_users(db, limit, cursor)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return FastJSONResponse(users, headers=headers)
+
+
+@router.get("/logged-in-user", response_model=UserResponse)
+def get_logged_in_user(current_user: int = Depends(get_current_user)):
+    return current_user
+
+
+@router.get('/{id}', response_model=UserResponse)
+def get_user(id: int, db: Session = Depends(get_read_db)):
+    return read_user(db, id)
@@ -1,37 +1,170 @@
-from fastapi import APIRouter, status, HTTPException, Depends
+from typing import Dict, List
+from fastapi import APIRouter, status, HTTPException, Depends, Response, Body
+from sqlalchemy import case, delete, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from ..database import get_db
 from .. import models
-from ..schemas import Vote
+from ..schemas import Vote, VoteResult, VoteBatchResult
 from .oauth2 import get_current_user
+from .post import post_response_cache
+from ..ranking import hot_score_expr
 
 router = APIRouter(
     prefix="/votes",
     tags=["votes"]
 )
 
+MAX_BATCH_VOTES = 1000
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
-def vote(vote: Vote, db: Session = Depends(get_db), current_user: int = Depends(get_current_user)):
-    post = db.query(models.Post).filter(models.Post.id == vote.post_id).first()
-    if not post:
+
+def _vote_change(db: Session, vote: Vote, user_id: int):
+    """Statement adding or removing the vote, returning the affected post_id.
+
+    Both are no-ops when the vote is already in the requested state, which is
+    what makes replays and concurrent double-clicks safe.
+    """
+    if vote.dir == 1:
+        insert = (pg_insert if db.get_bind().dialect.name == "postgresql"
+                  else sqlite_insert)
+        return insert(models.Vote).values(
+            post_id=vote.post_id, user_id=user_id
+        ).on_conflict_do_nothing().returning(models.Vote.post_id)
+    return delete(models.Vote).where(
+        models.Vote.post_id == vote.post_id, models.Vote.user_id == user_id
+    ).returning(models.Vote.post_id)
+
+
+def apply_vote(db: Session, vote: Vote, user_id: int) -> VoteResult:
+    """Put user_id's vote on a post in the requested state and commit.
+
+    On PostgreSQL the vote write and the counter update are one statement:
+    the insert/delete runs in a CTE and the UPDATE of posts adds the number
+    of rows it changed. A missing post surfaces as the votes foreign key
+    violation or as an UPDATE that matched nothing.
+    """
+    sign = 1 if vote.dir == 1 else -1
+    dialect = db.get_bind().dialect.name
+    change = _vote_change(db, vote, user_id)
+    try:
+        if dialect == "postgresql":
+            changed = change.cte("changed")
+            # pylint: disable=not-callable
+            changed_rows = select(func.count()).select_from(changed).scalar_subquery()
+            # pylint: enable=not-callable
+            returned_changed = changed_rows
+        else:
+            changed_rows = len(db.execute(change).all())
+            returned_changed = literal(changed_rows)
+        new_count = models.Post.vote_count + sign * changed_rows
+        row = db.execute(
+            update(models.Post).where(models.Post.id == vote.post_id).values(
+                vote_count=new_count,
+                hot_score=hot_score_expr(dialect, new_count, models.Post.created_at),
+            ).returning(models.Post.vote_count, returned_changed)
+        ).first()
+    except IntegrityError:
+        row = None
+    if row is None:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Post not found")
-    vote_query = db.query(models.Vote).filter(
-        models.Vote.post_id == vote.post_id, models.Vote.user_id == current_user.id)
-    found_vote = vote_query.first()
+    db.commit()
+
+    vote_count, changed = row
+    if changed:
+        post_response_cache.invalidate()
     if vote.dir == 1:
-        if found_vote:
-            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
-                                detail=f"User with user id {current_user.id} has already voted on post {vote.post_id}")
-        new_vote = models.Vote(post_id=vote.post_id, user_id=current_user.id)
-        db.add(new_vote)
-        db.commit()
-        return {"message": "successfully added vote"}
+        message = "successfully added vote" if changed else "vote already added"
     else:
-        if not found_vote:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
-                                detail=f"User with user id {current_user.id} has not voted on post {vote.post_id}")
-        vote_query.delete(synchronize_session=False)
-        db.commit()
-        return {"message": "successfully deleted vote"}
+        message = "successfully deleted vote" if changed else "no vote to delete"
+    return VoteResult(message=message, post_id=vote.post_id,
+                      voted=vote.dir == 1, changed=bool(changed), votes=vote_count)
+
+
+def apply_vote_batch(db: Session, votes: List[Vote],
+                     user_id: int) -> List[VoteBatchResult]:
+    """Apply a batch of votes in one transaction with a fixed number of statements.
+
+    Only the last item per post counts, as if the votes had been replayed one
+    by one. Votes on posts that don't exist are reported, not applied.
+    """
+    final = {vote.post_id: vote for vote in votes}
+    if not final:
+        return []
+
+    # FOR KEY SHARE keeps the posts from being deleted before the votes land
+    counts: Dict[int, int] = dict(db.execute(
+        select(models.Post.id, models.Post.vote_count)
+        .where(models.Post.id.in_(final))
+        .with_for_update(key_share=True)
+    ).all())
+    upvoted = [post_id for post_id, vote in final.items()
+               if vote.dir == 1 and post_id in counts]
+    downvoted = [post_id for post_id, vote in final.items()
+                 if vote.dir == 0 and post_id in counts]
+
+    deltas: Dict[int, int] = {}
+    if upvoted:
+        insert = (pg_insert if db.get_bind().dialect.name == "postgresql"
+                  else sqlite_insert)
+        added = db.execute(
+            insert(models.Vote).values(
+                [{"post_id": post_id, "user_id": user_id} for post_id in upvoted]
+            ).on_conflict_do_nothing().returning(models.Vote.post_id)
+        ).scalars()
+        deltas.update((post_id, 1) for post_id in added)
+    if downvoted:
+        deleted = db.execute(
+            delete(models.Vote).where(
+                models.Vote.user_id == user_id, models.Vote.post_id.in_(downvoted)
+            ).returning(models.Vote.post_id)
+        ).scalars()
+        deltas.update((post_id, -1) for post_id in deleted)
+    if deltas:
+        new_count = models.Post.vote_count + case(deltas, value=models.Post.id)
+        counts.update(db.execute(
+            update(models.Post).where(models.Post.id.in_(deltas)).values(
+                vote_count=new_count,
+                hot_score=hot_score_expr(db.get_bind().dialect.name, new_count,
+                                         models.Post.created_at),
+            ).returning(models.Post.id, models.Post.vote_count)
+        ).all())
+    db.commit()
+    if deltas:
+        post_response_cache.invalidate()
+
+    results = []
+    for vote in votes:
+        if final[vote.post_id] is not vote:
+            outcome = "superseded"
+        elif vote.post_id not in counts:
+            outcome = "not_found"
+        elif vote.post_id not in deltas:
+            outcome = "unchanged"
+        else:
+            outcome = "added" if vote.dir == 1 else "deleted"
+        results.append(VoteBatchResult(post_id=vote.post_id, dir=vote.dir,
+                                       status=outcome,
+                                       votes=counts.get(vote.post_id)))
+    return results
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, response_model=VoteResult)
+def vote(vote: Vote, response: Response, db: Session = Depends(get_db),
+         current_user: int = Depends(get_current_user)):
+    """Set the caller's vote on a post; 200 instead of 201 when nothing changed."""
+    result = apply_vote(db, vote, current_user.id)
+    if not result.changed:
+        response.status_code = status.HTTP_200_OK
+    return result
+
+
+@router.post("/batch", response_model=List[VoteBatchResult])
+def vote_batch(votes: List[Vote] = Body(..., max_length=MAX_BATCH_VOTES),
+               db: Session = Depends(get_db),
+               current_user: int = Depends(get_current_user)):
+    """Replay queued votes in one transaction and report the outcome of each."""
+    return apply_vote_batch(db, votes, current_user.id)
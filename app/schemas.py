@@ -19,6 +19,12 @@ class PostCreate(PostBase):
     pass
 
 
+class PostUpdate(BaseModel):
+    title: Optional[str] = None
+    content: Optional[str] = None
+    published: Optional[bool] = None
+
+
 class UserResponse(BaseModel):
     id: int
     email: EmailStr
@@ -73,3 +79,20 @@ class Vote(BaseModel):
         if v not in [0, 1]:
             raise ValueError('dir must be 0 or 1')
         return v
+
+
+class VoteResult(BaseModel):
+    message: str
+    post_id: int
+    voted: bool
+    changed: bool
+    votes: int
+
+
+class VoteBatchResult(BaseModel):
+    post_id: int
+    dir: int
+    # "added", "deleted", "unchanged", "superseded" (a later item in the batch
+    # targets the same post) or "not_found"
+    status: str
+    votes: Optional[int] = None
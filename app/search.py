@@ -0,0 +1,166 @@
+"""Full-text search over post titles and content.
+
+On PostgreSQL, posts are matched against the generated ``posts.search_vector``
+tsvector column and its GIN index, and ranked with ``ts_rank_cd``. Other
+databases (SQLite in local and test setups) fall back to an in-process
+inverted index per database, built from the posts table on first use.
+"""
+import re
+import threading
+import weakref
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional
+from sqlalchemy import func, literal_column
+from sqlalchemy.orm import Session
+from . import models
+
+SEARCH_CONFIG = "english"
+SEARCH_VECTOR = literal_column("posts.search_vector")
+TITLE_WEIGHT = 2
+
+_word = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into lowercase word tokens."""
+    return _word.findall(text.lower()) if text else []
+
+
+def uses_full_text(db: Session) -> bool:
+    """Whether the session's database has the tsvector search column."""
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def full_text_match(terms: List[str]):
+    """Build the match condition and rank expression for the search terms.
+
+    Every term is matched as a prefix so results update while the user is
+    still typing the last word.
+    """
+    # pylint: disable=not-callable
+    tsquery = func.to_tsquery(
+        SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+    return SEARCH_VECTOR.op("@@")(tsquery), func.ts_rank_cd(SEARCH_VECTOR, tsquery)
+    # pylint: enable=not-callable
+
+
+class InvertedIndex:
+    """Thread-safe in-memory inverted index of post titles and content."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._documents: Dict[int, Counter] = {}
+        self._vocabulary: List[str] = []
+        self._vocabulary_dirty = False
+        self._loaded = False
+
+    def load(self, db: Session):
+        """Build the index from the posts table if it has not been built yet."""
+        if self._loaded:
+            return
+        rows = db.query(models.Post.id, models.Post.title,
+                        models.Post.content).all()
+        with self._lock:
+            if self._loaded:
+                return
+            for post_id, title, content in rows:
+                self._add(post_id, title, content)
+            self._loaded = True
+
+    def add(self, post_id: int, title: str, content: str):
+        """Index a post, replacing any previous version of it."""
+        with self._lock:
+            if self._loaded:
+                self._remove(post_id)
+                self._add(post_id, title, content)
+
+    def remove(self, post_id: int):
+        """Drop a post from the index."""
+        with self._lock:
+            if self._loaded:
+                self._remove(post_id)
+
+    def clear(self):
+        """Forget everything; the index is rebuilt on the next search."""
+        with self._lock:
+            self._postings.clear()
+            self._documents.clear()
+            self._vocabulary = []
+            self._loaded = False
+
+    def search(self, db: Session, terms: List[str]) -> List[int]:
+        """Return ids of posts matching every term (as a prefix), best first."""
+        if not terms:
+            return []
+        self.load(db)
+        with self._lock:
+            if self._vocabulary_dirty:
+                self._vocabulary = sorted(self._postings)
+                self._vocabulary_dirty = False
+            scores: Optional[Counter] = None
+            for term in terms:
+                term_scores: Counter = Counter()
+                position = bisect_left(self._vocabulary, term)
+                while (position < len(self._vocabulary)
+                       and self._vocabulary[position].startswith(term)):
+                    term_scores.update(self._postings[self._vocabulary[position]])
+                    position += 1
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = Counter({post_id: scores[post_id] + count
+                                      for post_id, count in term_scores.items()
+                                      if post_id in scores})
+                if not scores:
+                    return []
+        return sorted(scores, key=lambda post_id: (-scores[post_id], -post_id))
+
+    def _add(self, post_id: int, title: str, content: str):
+        counts = Counter(tokenize(content))
+        for word in tokenize(title):
+            counts[word] += TITLE_WEIGHT
+        self._documents[post_id] = counts
+        for word, count in counts.items():
+            if word not in self._postings:
+                self._postings[word] = {}
+                self._vocabulary_dirty = True
+            self._postings[word][post_id] = count
+
+    def _remove(self, post_id: int):
+        for word in self._documents.pop(post_id, ()):
+            postings = self._postings[word]
+            postings.pop(post_id, None)
+            if not postings:
+                del self._postings[word]
+                self._vocabulary_dirty = True
+
+
+# Keyed by app.database.Database, so apps on different databases don't
+# share an index
+_post_indexes: "weakref.WeakKeyDictionary[object, InvertedIndex]" = (
+    weakref.WeakKeyDictionary())
+_post_indexes_lock = threading.Lock()
+
+
+def post_index(db: Session) -> InvertedIndex:
+    """The fallback index of the session's database."""
+    database = db.info["database"]
+    index = _post_indexes.get(database)
+    if index is None:
+        with _post_indexes_lock:
+            index = _post_indexes.setdefault(database, InvertedIndex())
+    return index
+
+
+def index_post(db: Session, post: models.Post):
+    """Keep the fallback index in step with a created or updated post."""
+    if not uses_full_text(db):
+        post_index(db).add(post.id, post.title, post.content)
+
+
+def unindex_post(db: Session, post_id: int):
+    """Remove a deleted post from the fallback index."""
+    if not uses_full_text(db):
+        post_index(db).remove(post_id)
@@ -0,0 +1,50 @@
+"""Fast-path JSON serialization for rows read from the database.
+
+Rows coming out of the database were validated on the way in, so read paths
+skip Pydantic entirely: posts are copied into plain dicts in the
+PostResponse shape and encoded with orjson. PostResponse stays the declared
+response_model for the OpenAPI schema, but endpoints return a
+FastJSONResponse so FastAPI doesn't validate and serialize the result again.
+"""
+from typing import Any, Optional
+import orjson
+from fastapi.responses import JSONResponse
+from . import models
+
+# Aware datetimes as "...Z" rather than "+00:00", matching Pydantic's output
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def dump_json(content: Any) -> bytes:
+    """Encode dicts, lists and datetimes to JSON bytes."""
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson."""
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content)
+
+
+def post_to_dict(post: models.Post, owner: Optional[Any] = None) -> dict:
+    """Copy a post and its loaded owner into the PostResponse shape.
+
+    `post` may also be a row of post columns, with the owner passed separately.
+    """
+    owner = owner if owner is not None else post.owner
+    return {
+        "title": post.title,
+        "content": post.content,
+        "published": post.published,
+        "id": post.id,
+        "created_at": post.created_at,
+        "owner_id": post.owner_id,
+        "owner": {
+            "id": owner.id,
+            "email": owner.email,
+            "created_at": owner.created_at,
+            "updated_at": owner.updated_at,
+        },
+        "votes": post.vote_count,
+    }
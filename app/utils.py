@@ -1,15 +1,151 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from argon2 import PasswordHasher
+from starlette.concurrency import run_in_threadpool
+from .config import settings
 
-ph = PasswordHasher()
+ph = PasswordHasher(
+    time_cost=settings.argon2_time_cost,
+    memory_cost=settings.argon2_memory_cost,
+    parallelism=settings.argon2_parallelism,
+)
 
-def hash_password(password: str) -> str:
-    """Hash a password using Argon2"""
+
+class PasswordHashingBusy(Exception):
+    """The hashing pool is saturated or a job waited past its timeout."""
+
+
+def _init_worker(time_cost: int, memory_cost: int, parallelism: int):
+    global ph  # pylint: disable=global-statement
+    ph = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost,
+                        parallelism=parallelism)
+
+
+def _hash(password: str) -> str:
     return ph.hash(password)
 
-def verify_password(password: str, hashed_password: str) -> bool:
-    """Verify a password against its hash"""
+
+def _verify(password: str, hashed_password: str) -> bool:
     try:
         ph.verify(hashed_password, password)
         return True
     except Exception:
         return False
+
+
+class HashingPool:
+    """Runs Argon2 jobs in worker processes with a cap on admitted jobs.
+
+    Jobs beyond `max_pending` (running plus queued) are rejected straight
+    away, and callers give up on a job after `timeout` seconds. The login
+    and signup endpoints await run_async(), so a login burst occupies the
+    hashing workers but not the request threadpool or event loop; run()
+    blocks its calling thread and is meant for scripts. With `workers=0`
+    jobs run in the caller (a threadpool thread for run_async()).
+    """
+
+    def __init__(self, workers: int, max_pending: int, timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn rather than fork: the server process is multithreaded
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(ph.time_cost, ph.memory_cost, ph.parallelism),
+                )
+            return self._executor
+
+    def _admit(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise PasswordHashingBusy("Too many password hashing jobs queued")
+            self.pending += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self.pending -= 1
+
+    def _submit(self, fn, *args) -> Future:
+        self._admit()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn, *args):
+        """Run a hashing job and block the calling thread for its result."""
+        if not self.workers:
+            self._admit()
+            try:
+                return fn(*args)
+            finally:
+                self._release()
+        future = self._submit(fn, *args)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHashingBusy("Password hashing timed out")
+
+    async def run_async(self, fn, *args):
+        """Run a hashing job without blocking the event loop."""
+        if not self.workers:
+            return await run_in_threadpool(self.run, fn, *args)
+        future = self._submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise PasswordHashingBusy("Password hashing timed out")
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+hashing_pool = HashingPool(
+    workers=settings.password_hash_workers,
+    max_pending=settings.password_hash_max_pending,
+    timeout=settings.password_hash_timeout_seconds,
+)
+
+
+def hash_password(password: str) -> str:
+    """Hash a password using Argon2"""
+    return hashing_pool.run(_hash, password)
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    """Verify a password against its hash"""
+    return hashing_pool.run(_verify, password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password for async code paths."""
+    return await hashing_pool.run_async(_hash, password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    """verify_password for async code paths."""
+    return await hashing_pool.run_async(_verify, password, hashed_password)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """Whether a hash was made with other Argon2 parameters than the current ones."""
+    return ph.check_needs_rehash(hashed_password)
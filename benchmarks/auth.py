@@ -0,0 +1,58 @@
+"""Measure the per-request cost of authenticating a bearer token.
+
+"decode" is what every authenticated request used to pay: python-jose
+checking the HMAC signature and parsing the claims. "cached" is a repeat
+presentation of the same token, answered from the verified-token cache.
+"dependency" is the whole get_current_user dependency on a warm token and
+user cache, i.e. the auth overhead a request actually sees now. No database
+is involved.
+
+Usage:
+    python -m benchmarks.auth [--repeat N]
+"""
+import argparse
+import sys
+import timeit
+from datetime import datetime, timezone
+
+from jose import jwt
+
+from app.database import default_database
+from app.routers import oauth2
+from app.schemas import UserResponse
+
+NUMBER = 10000
+
+
+def per_call_us(fn, repeat: int) -> float:
+    return min(timeit.repeat(fn, number=NUMBER, repeat=repeat)) / NUMBER * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    token = oauth2.create_access_token({"user_id": 1})
+    now = datetime.now(timezone.utc)
+    # A session is only needed for its cache scope; the user cache is warm
+    db = default_database().session_factory()
+    oauth2.user_cache.set(oauth2.cached_user_key(db, 1), UserResponse.model_construct(
+        id=1, email="user@example.com", created_at=now, updated_at=now))
+
+    decode = per_call_us(
+        lambda: jwt.decode(token, oauth2.SECRET_KEY, algorithms=[oauth2.ALGORITHM]),
+        args.repeat)
+    cached = per_call_us(lambda: oauth2.decode_token(token), args.repeat)
+    dependency = per_call_us(lambda: oauth2.get_current_user(token, db=db),
+                             args.repeat)
+
+    print(f"{'path':>10} {'us/request':>11}")
+    print(f"{'decode':>10} {decode:>11.2f}")
+    print(f"{'cached':>10} {cached:>11.2f}  ({decode / cached:.1f}x faster)")
+    print(f"{'dependency':>10} {dependency:>11.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
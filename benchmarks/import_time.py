@@ -0,0 +1,81 @@
+"""Check how long `import app.main` takes against a budget.
+
+Runs a fresh interpreter with `python -X importtime -c "import app.main"`
+a few times and keeps the fastest run, since cold starts under autoscaling
+are mostly import time. Reports the total, the share spent in the app's own
+modules (excluding what they import) and the slowest modules, and fails
+when the total or the app's own share is over budget, or when importing the
+app loaded a database driver, which means an engine was created at import.
+
+Usage:
+    python -m benchmarks.import_time [--runs N] [--budget-ms MS]
+                                     [--app-budget-ms MS] [--top N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+MODULE = "app.main"
+# Only imported by create_engine(); none should be loaded by the import
+DRIVERS = ("psycopg2", "psycopg", "aiosqlite", "redis")
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times() -> List[Tuple[str, int, int]]:
+    """(module, self us, cumulative us) of every module `import app.main` loads."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500,
+                        help="budget for the whole import")
+    parser.add_argument("--app-budget-ms", type=float, default=200,
+                        help="budget for the app's own modules")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.runs)]
+    totals = [next(cumulative for name, _, cumulative in rows if name == MODULE)
+              for rows in runs]
+    best = runs[totals.index(min(totals))]
+    total_ms = min(totals) / 1000
+    own: Dict[str, int] = {name: self_us for name, self_us, _ in best
+                           if name == "app" or name.startswith("app.")}
+    own_ms = sum(own.values()) / 1000
+    drivers = sorted({name for name, _, _ in best if name in DRIVERS})
+
+    print(f"import {MODULE}: {total_ms:.1f}ms (budget {args.budget_ms:.0f}ms), "
+          f"app modules {own_ms:.1f}ms (budget {args.app_budget_ms:.0f}ms)")
+    print(f"\n{'self ms':>8} {'cumul ms':>9}  module")
+    slowest = sorted(best, key=lambda row: -row[1])[:args.top]
+    for name, self_us, cumulative_us in slowest:
+        print(f"{self_us / 1000:>8.1f} {cumulative_us / 1000:>9.1f}  {name}")
+
+    failures = []
+    if total_ms > args.budget_ms:
+        failures.append(f"import took {total_ms:.1f}ms, over {args.budget_ms:.0f}ms")
+    if own_ms > args.app_budget_ms:
+        failures.append(f"app modules took {own_ms:.1f}ms, "
+                        f"over {args.app_budget_ms:.0f}ms")
+    if drivers:
+        failures.append(f"database drivers loaded at import: {', '.join(drivers)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
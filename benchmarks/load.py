@@ -0,0 +1,260 @@
+"""Load-test the API's hot paths against a local database.
+
+Starts the app under uvicorn in this process, seeds users, posts and votes,
+then drives each scenario with concurrent httpx clients and reports latency
+percentiles, throughput and SQL statements per request. Results are written
+as JSON so runs on different commits can be compared. Client and server
+share one process (that's what lets statements be counted on the engine),
+so absolute numbers are pessimistic; compare runs, not deployments.
+
+By default a scratch SQLite file is used. Pass --database-url to run against
+a local PostgreSQL database; it must be empty, since it gets seeded.
+
+Usage:
+    python -m benchmarks.load [--users N] [--posts N] [--votes N]
+                              [--concurrency N] [--requests N]
+                              [--database-url URL] [--output FILE]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+import httpx
+
+SCENARIOS = ("login", "list_posts", "get_post", "vote", "list_users")
+# Logins are bound by Argon2, so they get a fraction of the request count
+LOGIN_SHARE = 0.1
+PASSWORD = "benchmark-password"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def start_server(port: int):
+    import uvicorn
+    from app.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port,
+                                           log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("server failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+def seed(users: int, posts: int, votes: int, chunk_size: int = 10000):
+    """Insert the benchmark data with bulk statements; return the user ids."""
+    from sqlalchemy import func, insert, select
+    from app import models
+    from app.database import default_database
+    from app.maintenance import reconcile_vote_counts
+    from app.utils import hash_password
+
+    db = default_database().session_factory()
+    try:
+        # pylint: disable=not-callable
+        if db.scalar(select(func.count()).select_from(models.User)):
+            raise SystemExit("The benchmark database must be empty")
+        # pylint: enable=not-callable
+        hashed = hash_password(PASSWORD)
+        for start in range(0, users, chunk_size):
+            db.execute(insert(models.User), [
+                {"email": f"bench{i}@example.com", "password": hashed}
+                for i in range(start, min(start + chunk_size, users))])
+        user_ids = db.scalars(select(models.User.id)).all()
+        for start in range(0, posts, chunk_size):
+            db.execute(insert(models.Post), [
+                {"title": f"Post {i}", "content": f"Benchmark post number {i}",
+                 "owner_id": random.choice(user_ids)}
+                for i in range(start, min(start + chunk_size, posts))])
+        post_ids = db.scalars(select(models.Post.id)).all()
+        pairs = set()
+        votes = min(votes, len(user_ids) * len(post_ids))
+        while len(pairs) < votes:
+            pairs.add((random.choice(user_ids), random.choice(post_ids)))
+        pairs = list(pairs)
+        for start in range(0, len(pairs), chunk_size):
+            db.execute(insert(models.Vote), [
+                {"user_id": user_id, "post_id": post_id}
+                for user_id, post_id in pairs[start:start + chunk_size]])
+        db.commit()
+        reconcile_vote_counts(db)
+        return user_ids, post_ids
+    finally:
+        db.close()
+
+
+def build_requests(user_ids: List[int], post_ids: List[int]) -> Dict[str, Callable]:
+    """Map each scenario to a function returning the kwargs of one request."""
+    from app.routers.oauth2 import create_access_token
+
+    tokens = {user_id: create_access_token(data={"user_id": user_id})
+              for user_id in random.sample(user_ids, min(len(user_ids), 200))}
+    token_users = list(tokens)
+
+    def auth():
+        return {"Authorization": f"Bearer {tokens[random.choice(token_users)]}"}
+
+    def login():
+        index = random.randrange(len(user_ids))
+        return {"method": "POST", "url": "/login",
+                "data": {"username": f"bench{index}@example.com", "password": PASSWORD}}
+
+    def list_posts():
+        skip = random.randrange(0, min(len(post_ids), 1000), 10)
+        return {"method": "GET", "url": f"/posts/?limit=10&skip={skip}",
+                "headers": auth()}
+
+    def get_post():
+        return {"method": "GET", "url": f"/posts/{random.choice(post_ids)}",
+                "headers": auth()}
+
+    def vote():
+        return {"method": "POST", "url": "/votes/", "headers": auth(),
+                "json": {"post_id": random.choice(post_ids),
+                         "dir": random.randint(0, 1)}}
+
+    def list_users():
+        return {"method": "GET", "url": "/users/?limit=100"}
+
+    return {"login": login, "list_posts": list_posts, "get_post": get_post,
+            "vote": vote, "list_users": list_users}
+
+
+async def run_scenario(base_url: str, make_request: Callable, total: int,
+                       concurrency: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    remaining = total
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            request = make_request()
+            started = time.perf_counter()
+            response = await client.request(**request)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits,
+                                 timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "p50_ms": round(percentiles[49] * 1000, 2),
+        "p95_ms": round(percentiles[94] * 1000, 2),
+        "p99_ms": round(percentiles[98] * 1000, 2),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--votes", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="requests per scenario (default: 2000)")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS,
+                        default=list(SCENARIOS))
+    parser.add_argument("--database-url",
+                        help="empty database to seed (default: scratch SQLite)")
+    parser.add_argument("--output", default="load-results.json")
+    args = parser.parse_args()
+
+    # Configure the app before anything imports it
+    database_url = args.database_url or "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(), "load.db")
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("AUTO_MIGRATE", "true")
+
+    from app.database import default_database
+    from app.instrumentation import QueryCounter
+
+    engine = default_database().engine
+
+    # httpx logs every request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    port = free_port()
+    server, thread = start_server(port)  # startup migrates the schema
+    try:
+        print(f"Seeding {args.users} users, {args.posts} posts, {args.votes} votes")
+        user_ids, post_ids = seed(args.users, args.posts, args.votes)
+        make_requests = build_requests(user_ids, post_ids)
+
+        results = {}
+        for name in args.scenarios:
+            total = args.requests
+            if name == "login":
+                total = max(1, int(total * LOGIN_SHARE))
+            with QueryCounter(engine) as counter:
+                result = asyncio.run(run_scenario(
+                    f"http://127.0.0.1:{port}", make_requests[name], total,
+                    args.concurrency))
+            result["statements_per_request"] = round(
+                counter.count / result["requests"], 2)
+            results[name] = result
+            print(f"{name:<11} {result['throughput_rps']:>8} req/s  "
+                  f"p50 {result['p50_ms']:>7}ms  p95 {result['p95_ms']:>7}ms  "
+                  f"p99 {result['p99_ms']:>7}ms  "
+                  f"{result['statements_per_request']} stmt/req  "
+                  f"{result['errors']} errors")
+    finally:
+        server.should_exit = True
+        thread.join()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "database": engine.dialect.name,
+        "seed": {"users": args.users, "posts": args.posts, "votes": args.votes},
+        "concurrency": args.concurrency,
+        "scenarios": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as out:
+        json.dump(report, out, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Check that post listings issue a constant number of SQL statements.
+
+Seeds a throwaway SQLite database with posts from distinct owners, calls each
+listing endpoint with growing page sizes and exits non-zero if any call goes
+over its statement budget (an N+1 regression shows up as a count that grows
+with the page size).
+
+Usage:
+    python -m benchmarks.query_budget
+"""
+import logging
+import os
+import sys
+import tempfile
+
+# Never seed the configured database: point the app at a scratch file first.
+_scratch = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'budget.db')}"
+
+# pylint: disable=wrong-import-position
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import models  # noqa: E402
+from app.database import default_database  # noqa: E402
+from app.instrumentation import QueryCounter  # noqa: E402
+from app.main import app  # noqa: E402
+from app.routers.oauth2 import create_access_token  # noqa: E402
+
+PAGE_SIZES = (1, 10, 100)
+# One statement to load the current user, one for the listing itself.
+BUDGET = 2
+
+
+def seed(count: int) -> int:
+    """Create `count` posts, each with its own owner; return the first owner's id."""
+    db = default_database().session_factory()
+    try:
+        users = [models.User(email=f"user{i}@example.com", password="x")
+                 for i in range(count)]
+        db.add_all(users)
+        db.flush()
+        db.add_all([models.Post(title=f"post {i}", content="content",
+                                owner_id=user.id)
+                    for i, user in enumerate(users)])
+        db.commit()
+        return users[0].id
+    finally:
+        db.close()
+
+
+def main() -> int:
+    # httpx logs every request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    models.Base.metadata.create_all(bind=default_database().engine)
+    user_id = seed(max(PAGE_SIZES))
+    client = TestClient(app)
+    headers = {"Authorization":
+               f"Bearer {create_access_token(data={'user_id': user_id})}"}
+
+    endpoints = [f"/posts/?limit={size}" for size in PAGE_SIZES]
+    endpoints += ["/posts/my-posts", f"/posts/{user_id}"]
+    failed = False
+    for url in endpoints:
+        with QueryCounter(default_database().engine) as counter:
+            response = client.get(url, headers=headers)
+        response.raise_for_status()
+        ok = counter.count <= BUDGET
+        failed = failed or not ok
+        print(f"{'ok  ' if ok else 'FAIL'} GET {url}: "
+              f"{counter.count} statements (budget {BUDGET})")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
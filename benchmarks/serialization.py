@@ -0,0 +1,77 @@
+"""Compare the per-post cost of serializing a page of posts.
+
+"pydantic" is the path post listings used to take: validate every row into a
+PostResponse (EmailStr included), then let FastAPI dump, re-validate and
+encode the list against response_model=List[PostResponse]. "fast" is the
+current path: copy the trusted rows into dicts and encode them with orjson.
+No database is involved; the posts are transient ORM objects.
+
+Usage:
+    python -m benchmarks.serialization [--repeat N]
+"""
+import argparse
+import json
+import sys
+import timeit
+from datetime import datetime, timezone
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app import models
+from app.schemas import PostResponse
+from app.serialization import dump_json, post_to_dict
+
+PAGE_SIZES = (10, 100, 1000)
+
+response_adapter = TypeAdapter(List[PostResponse])
+
+
+def make_posts(count: int) -> List[models.Post]:
+    now = datetime.now(timezone.utc)
+    posts = []
+    for i in range(count):
+        owner = models.User(id=i + 1, email=f"user{i}@example.com",
+                            created_at=now, updated_at=now)
+        posts.append(models.Post(id=i + 1, title=f"post {i}",
+                                 content="lorem ipsum " * 20, published=True,
+                                 created_at=now, owner_id=owner.id,
+                                 owner=owner, vote_count=i))
+    return posts
+
+
+def pydantic_path(posts: List[models.Post]) -> bytes:
+    validated = [PostResponse.model_validate(post) for post in posts]
+    # What FastAPI does with the endpoint's return value
+    content = response_adapter.validate_python(
+        [post.model_dump() for post in validated])
+    return json.dumps(response_adapter.dump_python(content, mode="json")).encode()
+
+
+def fast_path(posts: List[models.Post]) -> bytes:
+    return dump_json([post_to_dict(post) for post in posts])
+
+
+def per_post_us(fn, posts: List[models.Post], repeat: int) -> float:
+    number = max(1, 10000 // len(posts))
+    best = min(timeit.repeat(lambda: fn(posts), number=number, repeat=repeat))
+    return best / number / len(posts) * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'posts':>6} {'pydantic us/post':>17} {'fast us/post':>13} {'speedup':>8}")
+    for size in PAGE_SIZES:
+        posts = make_posts(size)
+        assert json.loads(pydantic_path(posts)) == json.loads(fast_path(posts))
+        before = per_post_us(pydantic_path, posts, args.repeat)
+        after = per_post_us(fast_path, posts, args.repeat)
+        print(f"{size:>6} {before:>17.2f} {after:>13.2f} {before / after:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Operational commands for the API.
+
+Usage:
+    python manage.py migrate [--revision REV] [--check]
+    python manage.py reconcile-votes [--batch-size N]
+    python manage.py export DIR [--tables T ...] [--chunk-size N]
+    python manage.py import DIR [--tables T ...] [--chunk-size N]
+"""
+import argparse
+import sys
+
+from app.database import default_database
+
+# Engines are only created by the commands that need them
+database = default_database()
+
+
+def migrate(args):
+    from app import migrations
+
+    with database.engine.connect() as connection:
+        if args.check:
+            at_head = migrations.is_at_head(connection)
+            print("Database schema is at head" if at_head
+                  else "Database schema is behind head")
+            return 0 if at_head else 1
+        with migrations.advisory_lock(connection):
+            migrations.upgrade(connection, args.revision)
+    print(f"Database schema upgraded to {args.revision}")
+    return 0
+
+
+def reconcile_votes(args):
+    from app.maintenance import reconcile_vote_counts
+
+    db = database.session_factory()
+    try:
+        corrected = reconcile_vote_counts(db, batch_size=args.batch_size)
+    finally:
+        db.close()
+    print(f"Reconciled vote counts: {corrected} post(s) corrected")
+    return 0
+
+
+def export_data(args):
+    from app import bulk
+
+    for result in bulk.export_tables(database.engine, args.directory, args.tables,
+                                     chunk_size=args.chunk_size):
+        print(f"Exported {result}")
+    return 0
+
+
+def import_data(args):
+    from app import bulk
+
+    for result in bulk.import_tables(database.engine, args.directory, args.tables,
+                                     chunk_size=args.chunk_size):
+        print(f"Imported {result}")
+    return 0
+
+
+def add_bulk_arguments(parser):
+    from app.bulk import DEFAULT_CHUNK_SIZE, TABLES
+
+    parser.add_argument("directory", help="directory holding <table>.csv files")
+    parser.add_argument("--tables", nargs="+", choices=list(TABLES),
+                        default=list(TABLES), help="tables to copy (default: all)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"rows per batch (default: {DEFAULT_CHUNK_SIZE})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="manage.py", description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser(
+        "migrate", help="apply Alembic migrations (run before starting workers)")
+    migrate_parser.add_argument("--revision", default="head",
+                                help="target revision (default: head)")
+    migrate_parser.add_argument("--check", action="store_true",
+                                help="only report whether the schema is at head; "
+                                     "exit 1 if it is not")
+    migrate_parser.set_defaults(handler=migrate)
+
+    reconcile = commands.add_parser(
+        "reconcile-votes", help="recompute posts.vote_count from the votes table")
+    reconcile.add_argument("--batch-size", type=int, default=10000,
+                           help="posts per transaction (default: 10000)")
+    reconcile.set_defaults(handler=reconcile_votes)
+
+    export_parser = commands.add_parser(
+        "export", help="dump tables to CSV files (COPY on PostgreSQL)")
+    add_bulk_arguments(export_parser)
+    export_parser.set_defaults(handler=export_data)
+
+    import_parser = commands.add_parser(
+        "import", help="load tables from CSV files in one transaction; "
+                       "the tables should be empty")
+    add_bulk_arguments(import_parser)
+    import_parser.set_defaults(handler=import_data)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())